@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import requests
+
+# CASSETTE_MODE=record runs normally and saves every Spotify call, Last.fm request,
+# DB query and artist-page scrape result to CASSETTE_FILE; CASSETTE_MODE=replay runs
+# script.py from that file with no network, no DB and no Spotify auth.
+# Both modes seed the RNG with CASSETTE_SEED and select with a single worker; replay
+# also pins the clock (Cassette.now) to the time the recording started.
+CASSETTE_MODE = (os.environ.get("CASSETTE_MODE") or "").strip().lower() or None
+CASSETTE_FILE = os.environ.get("CASSETTE_FILE") or "cassette.json"
+CASSETTE_SEED = int(os.environ.get("CASSETTE_SEED") or 1234)
+
+# params that change between runs without changing the response (keys/time bounds)
+VOLATILE_PARAMS = ("api_key", "to")
+
+class RecordedResponse:
+    """Just enough of requests.Response for the Last.fm call sites."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    @classmethod
+    def from_response(cls, resp):
+        try:
+            body = resp.json()
+        except Exception:
+            body = resp.text
+        return cls(resp.status_code, body)
+
+    @property
+    def text(self):
+        return self.body if isinstance(self.body, str) else json.dumps(self.body)
+
+    def json(self):
+        if isinstance(self.body, str):
+            return json.loads(self.body)
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (cassette)", response=self)
+
+class ReplayRow(list):
+    """Replayed DB row: index access like a list, key access like psycopg2's DictRow."""
+
+    def __init__(self, cols, vals):
+        super().__init__(vals)
+        self._cols = {c: i for i, c in enumerate(cols)}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return super().__getitem__(self._cols[key])
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def keys(self):
+        return list(self._cols)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return [(c, self[i]) for c, i in self._cols.items()]
+
+def _row_columns(obj):
+    # psycopg2.extras.DictRow keeps its column -> index map in _index
+    index = getattr(obj, "_index", None)
+    if index is None and isinstance(obj, ReplayRow):
+        index = obj._cols
+    if index is None:
+        return None
+    return [c for c, _ in sorted(index.items(), key=lambda kv: kv[1])]
+
+def _encode(obj):
+    if isinstance(obj, list):
+        cols = _row_columns(obj)
+        if cols is not None:
+            return {"__row__": {"cols": cols, "vals": [_encode(v) for v in obj]}}
+    if isinstance(obj, dict):
+        return {str(k): _encode(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(v) for v in obj]
+    if isinstance(obj, datetime):
+        return {"__datetime__": obj.isoformat()}
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, RecordedResponse):
+        return {"__response__": {"status_code": obj.status_code, "body": _encode(obj.body)}}
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+def _decode(obj):
+    if isinstance(obj, list):
+        return [_decode(v) for v in obj]
+    if isinstance(obj, dict):
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+        if "__row__" in obj:
+            return ReplayRow(obj["__row__"]["cols"], _decode(obj["__row__"]["vals"]))
+        if "__response__" in obj:
+            return RecordedResponse(obj["__response__"]["status_code"], _decode(obj["__response__"]["body"]))
+        return {k: _decode(v) for k, v in obj.items()}
+    return obj
+
+def _fingerprint(args):
+    # psycopg2 Json params expose the wrapped value as .adapted
+    return json.dumps(args, sort_keys=True, default=lambda o: getattr(o, "adapted", None) or str(o))
+
+class Cassette:
+    """
+    Records call results in order and replays them. Replay first looks for an unused
+    entry with the same (kind, endpoint, args); if the args differ (timestamps in a
+    query, ...) it falls back to the next unused entry for that endpoint and counts a
+    divergence. A call with nothing left to replay is a miss and returns `default`.
+    """
+
+    def __init__(self, mode=None, path=CASSETTE_FILE, seed=CASSETTE_SEED):
+        if mode not in (None, "record", "replay"):
+            raise ValueError(f"CASSETTE_MODE must be 'record' or 'replay', got {mode!r}")
+        self.mode = mode
+        self.path = path
+        self.seed = seed
+        self.entries = []
+        self.calls = Counter()
+        self.misses = Counter()
+        self.divergences = Counter()
+        self._exact = defaultdict(deque)
+        self._by_endpoint = defaultdict(deque)
+        self._used = set()
+        self._start = time.monotonic()
+        self.started_at = datetime.now(timezone.utc)
+        # run facts replay must reproduce (e.g. whether the DB was available); saved in the header
+        self.meta = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.entries = data.get("entries", [])
+        if data.get("started_at"):
+            self.started_at = datetime.fromisoformat(data["started_at"])
+        self.meta = data.get("meta") or {}
+        for i, e in enumerate(self.entries):
+            self._exact[(e["kind"], e["endpoint"], e["args"])].append(i)
+            self._by_endpoint[(e["kind"], e["endpoint"])].append(i)
+        print(f"[CASSETTE] Replaying {len(self.entries)} recorded calls from {self.path} (recorded {data.get('recorded_at')})")
+
+    def now(self):
+        """Current UTC time; during replay, the time the recording started."""
+        if self.mode == "replay":
+            return self.started_at
+        return datetime.now(timezone.utc)
+
+    def _next_unused(self, queue):
+        while queue and queue[0] in self._used:
+            queue.popleft()
+        return queue.popleft() if queue else None
+
+    def call(self, kind, endpoint, args, fn, default=None):
+        """Run fn() (recording its result) or replay the recorded result. Inactive cassettes just call fn()."""
+        if not self.mode:
+            return fn()
+        fp = _fingerprint(args)
+        if self.mode == "record":
+            try:
+                result = fn()
+            except Exception as e:
+                self._append(kind, endpoint, fp, {"__error__": f"{type(e).__name__}: {e}"})
+                raise
+            self._append(kind, endpoint, fp, _encode(result))
+            return result
+
+        with self._lock:
+            self.calls[kind] += 1
+            idx = self._next_unused(self._exact[(kind, endpoint, fp)])
+            if idx is None:
+                idx = self._next_unused(self._by_endpoint[(kind, endpoint)])
+                if idx is None:
+                    self.misses[kind] += 1
+                    return default
+                self.divergences[kind] += 1
+            self._used.add(idx)
+            result = self.entries[idx]["result"]
+        if isinstance(result, dict) and "__error__" in result:
+            raise RuntimeError(f"recorded error: {result['__error__']}")
+        return _decode(result)
+
+    def call_http(self, kind, endpoint, args, fn):
+        """call() for functions returning a requests.Response; replays RecordedResponse objects."""
+        if not self.mode:
+            return fn()
+        return self.call(kind, endpoint, args, lambda: RecordedResponse.from_response(fn()),
+                         default=RecordedResponse(599, "no recorded response"))
+
+    def _append(self, kind, endpoint, fp, result):
+        with self._lock:
+            self.calls[kind] += 1
+            self.entries.append({"kind": kind, "endpoint": endpoint, "args": fp, "result": result})
+
+    def save(self):
+        if self.mode != "record":
+            return
+        with self._lock:
+            data = {
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "started_at": self.started_at.isoformat(),
+                "meta": dict(self.meta),
+                "seed": self.seed,
+                "entries": list(self.entries),
+            }
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+        print(f"[CASSETTE] Saved {len(data['entries'])} calls to {self.path}")
+
+    def report(self, accepted):
+        """Print and return wall time and calls per accepted track for this run."""
+        with self._lock:
+            calls = dict(self.calls)
+            stats = {
+                "mode": self.mode,
+                "wall_s": round(time.monotonic() - self._start, 3),
+                "accepted_tracks": accepted,
+                "calls": calls,
+                "calls_per_accepted_track": {k: round(v / accepted, 2) for k, v in calls.items()} if accepted else {},
+                "misses": dict(self.misses),
+                "divergences": dict(self.divergences),
+            }
+        print(f"[CASSETTE] {self.mode}: {stats['wall_s']:.2f}s wall, {accepted} tracks accepted, {sum(calls.values())} calls")
+        for kind, per_track in sorted(stats["calls_per_accepted_track"].items()):
+            print(f"[CASSETTE]   {kind}: {calls[kind]} calls ({per_track}/track)")
+        if self.misses or self.divergences:
+            print(f"[CASSETTE]   misses: {stats['misses']} | divergences: {stats['divergences']}")
+        return stats
+
+cassette = Cassette(CASSETTE_MODE)
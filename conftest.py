@@ -0,0 +1,13 @@
+import os
+
+import spotipy.oauth2
+
+# test_recs.py is the old standalone recommendation script, not a test module
+collect_ignore = ["test_recs.py"]
+
+# script.py authenticates with Spotify and reads these at import; tests never reach Spotify or Postgres
+os.environ.setdefault("SPOTIFY_CLIENT_ID", "test")
+os.environ.setdefault("SPOTIFY_CLIENT_SECRET", "test")
+os.environ.pop("DATABASE_URL", None)
+os.environ.pop("CASSETTE_MODE", None)
+spotipy.oauth2.SpotifyOAuth.refresh_access_token = lambda self, refresh_token: {"access_token": "test"}
@@ -1,62 +1,279 @@
 import os
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
 
-DB_CONN = None
+from cassette import cassette
+from telemetry import telemetry
 
-def get_db_conn():
-    global DB_CONN
-    if DB_CONN:
-        return DB_CONN
+# Shared connection pool used by db_helpers and script.py (see db_connection()).
+DB_POOL = None
+DB_POOL_SIZE = max(1, int(os.environ.get("DB_POOL_SIZE") or 4))
+# pooled connections idle longer than this are health-checked before reuse
+DB_IDLE_CHECK_SECONDS = 30
+DB_SLOW_QUERY_SECONDS = float(os.environ.get("DB_SLOW_QUERY_SECONDS") or 1.0)
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+_conn_last_used = {}
+
+# In-memory blacklist index. Loaded once by load_blacklist_index(); while loaded,
+# the is_*/count helpers below answer from memory and the add_* helpers keep it current.
+BLACKLIST_INDEX = None
+
+def _statement_key(sql):
+    text = " ".join((sql.decode() if isinstance(sql, bytes) else str(sql)).split())
+    # execute_values sends the rows inline; keep bulk statements under one key
+    head, sep, _ = text.partition(" VALUES ")
+    return (head + (" VALUES ..." if sep else ""))[:80]
+
+class TimedCursor(psycopg2.extras.DictCursor):
+    """DictCursor that reports per-statement timing to telemetry and logs slow statements."""
+
+    def execute(self, query, vars=None):
+        start = time.monotonic()
+        status = "error"
+        try:
+            result = super().execute(query, vars)
+            status = "ok"
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            key = _statement_key(query)
+            telemetry.record_call("db", key, elapsed, status)
+            if elapsed >= DB_SLOW_QUERY_SECONDS:
+                print(f"[DB] slow statement ({elapsed:.2f}s): {key}")
+
+def _get_pool():
+    global DB_POOL
+    if DB_POOL:
+        return DB_POOL
     db_url = os.environ.get("DATABASE_URL")
     if not db_url:
         # DB operations are effectively disabled when no DATABASE_URL
         return None
+    with _pool_lock:
+        if DB_POOL:
+            return DB_POOL
+        try:
+            DB_POOL = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_SIZE, db_url, cursor_factory=TimedCursor)
+        except Exception as e:
+            print(f"[DB] connection failed: {e}")
+            return None
+    return DB_POOL
+
+def db_enabled():
+    # during cassette replay the DB counts as available iff it was while recording;
+    # its statements are then answered from the recording
+    if cassette.replaying:
+        return bool(cassette.meta.get("db_enabled", True))
+    enabled = _get_pool() is not None
+    if cassette.mode == "record":
+        cassette.meta["db_enabled"] = enabled
+    return enabled
+
+def _connection_alive(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _conn_last_used.get(id(conn), 0) < DB_IDLE_CHECK_SECONDS:
+        return True
     try:
-        conn = psycopg2.connect(db_url)
-        conn.autocommit = True
-        DB_CONN = conn
-        return DB_CONN
-    except Exception as e:
-        print(f"[DB] connection failed: {e}")
-        return None
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
 
-def db_query(sql, params=None, fetch=False):
-    conn = get_db_conn()
-    if not conn:
-        return None
+def _discard(pool, conn):
+    _conn_last_used.pop(id(conn), None)
     try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(sql, params or ())
-            if fetch:
-                return cur.fetchall()
-    except Exception as e:
-        print(f"[DB] query failed: {e} | sql: {sql} | params: {params}")
+        pool.putconn(conn, close=True)
+    except Exception:
+        pass
+
+@contextmanager
+def db_connection():
+    """
+    Check out a healthy autocommit connection from the shared pool, blocking while
+    all DB_POOL_SIZE connections are in use. Yields None when the DB is unavailable.
+    """
+    pool = _get_pool()
+    if not pool:
+        yield None
+        return
+    with _pool_slots:
+        conn = None
+        try:
+            for _ in range(2):
+                conn = pool.getconn()
+                # before the liveness probe: a SELECT 1 on a non-autocommit connection
+                # opens a transaction, after which autocommit can't be switched on
+                if not conn.closed and not conn.autocommit:
+                    conn.autocommit = True
+                if _connection_alive(conn):
+                    break
+                print("[DB] pooled connection is dead; reconnecting")
+                _discard(pool, conn)
+                conn = None
+        except Exception as e:
+            print(f"[DB] connection failed: {e}")
+            if conn is not None:
+                _discard(pool, conn)
+            conn = None
+        if conn is None:
+            yield None
+            return
+        try:
+            yield conn
+        finally:
+            if conn.closed:
+                _discard(pool, conn)
+            else:
+                _conn_last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn)
+
+def close_db_pool():
+    global DB_POOL
+    with _pool_lock:
+        if DB_POOL:
+            try:
+                DB_POOL.closeall()
+            except Exception:
+                pass
+            DB_POOL = None
+            _conn_last_used.clear()
+
+def db_query(sql, params=None, fetch=False):
+    """Run one statement on a pooled connection. Returns rows if fetch, None on failure or when the DB is disabled."""
+    return cassette.call("db", _statement_key(sql), [params, fetch], lambda: _db_query(sql, params, fetch))
+
+def _db_query(sql, params, fetch):
+    for attempt in range(2):
+        with db_connection() as conn:
+            if not conn:
+                return None
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params or ())
+                    rows = cur.fetchall() if fetch else None
+                return rows
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # connection dropped mid-statement: retry once on a fresh connection
+                if attempt == 0 and conn.closed:
+                    telemetry.incr("db.retries")
+                    print(f"[DB] connection lost ({e}); retrying on a new connection")
+                    continue
+                print(f"[DB] query failed: {e} | sql: {sql} | params: {params}")
+                return None
+            except Exception as e:
+                print(f"[DB] query failed: {e} | sql: {sql} | params: {params}")
+                return None
+    return None
+
+def db_execute_values(sql, rows, template=None, page_size=500):
+    """Bulk statement via psycopg2.extras.execute_values on a pooled connection. Returns True on success."""
+    # rows are not part of the cassette key: liked-track imports can be thousands of rows
+    return cassette.call("db", _statement_key(sql), [len(rows)], lambda: _db_execute_values(sql, rows, template, page_size), default=False)
+
+def _db_execute_values(sql, rows, template, page_size):
+    with db_connection() as conn:
+        if not conn:
+            return False
+        try:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, sql, rows, template=template, page_size=page_size)
+            return True
+        except Exception as e:
+            print(f"[DB] bulk statement failed: {e} | sql: {_statement_key(sql)} | rows: {len(rows)}")
+            return False
+
+class BlacklistIndex:
+    def __init__(self):
+        self.songs = set()
+        self.artist_song_counts = Counter()
+        self.artists = set()
+        self.playlists = set()
+        self._lock = threading.Lock()
+
+    def add_song(self, song_id, artist_id=None):
+        with self._lock:
+            if not song_id or song_id in self.songs:
+                return
+            self.songs.add(song_id)
+            if artist_id:
+                self.artist_song_counts[artist_id] += 1
+
+    def add_artist(self, artist_id):
+        with self._lock:
+            self.artists.add(artist_id)
+
+    def add_playlist(self, playlist_id):
+        with self._lock:
+            self.playlists.add(playlist_id)
+
+def load_blacklist_index():
+    """Load every blacklist into memory with one query. Returns the index, or None if the DB is unavailable."""
+    global BLACKLIST_INDEX
+    rows = db_query("""
+        SELECT 'song' AS kind, song_id AS item_id, artist_id FROM blacklisted_songs
+        UNION ALL
+        SELECT 'artist', artist_playlist_id, NULL FROM blacklisted_artists_playlists
+        UNION ALL
+        SELECT 'playlist', playlist_id, NULL FROM user_playlists WHERE blacklisted
+        """, fetch=True)
+    if rows is None:
         return None
+    index = BlacklistIndex()
+    for kind, item_id, artist_id in rows:
+        if not item_id:
+            continue
+        if kind == "song":
+            index.add_song(item_id, artist_id)
+        elif kind == "artist":
+            index.add_artist(item_id)
+        else:
+            index.add_playlist(item_id)
+    BLACKLIST_INDEX = index
+    print(f"[DB] Loaded blacklist index: {len(index.songs)} songs, {len(index.artists)} artists, {len(index.playlists)} playlists")
+    return index
+
+def remember_blacklisted_song(song_id, artist_id=None):
+    """Record a song written to blacklisted_songs outside add_blacklisted_song."""
+    if BLACKLIST_INDEX is not None:
+        BLACKLIST_INDEX.add_song(song_id, artist_id)
 
 def is_artist_blacklisted(artist_id):
+    if BLACKLIST_INDEX is not None:
+        return artist_id in BLACKLIST_INDEX.artists
     rows = db_query("SELECT 1 FROM blacklisted_artists_playlists WHERE artist_playlist_id = %s LIMIT 1", (artist_id,), fetch=True)
     return bool(rows)
 
 def add_blacklisted_artist(artist_id, name=None):
-    conn = get_db_conn()
-    if not conn:
+    if not db_enabled():
         return
     try:
         db_query("INSERT INTO blacklisted_artists_playlists (artist_playlist_id, name) VALUES (%s, %s)", (artist_id, name))
     except Exception:
         pass
+    if BLACKLIST_INDEX is not None:
+        BLACKLIST_INDEX.add_artist(artist_id)
 
 def is_playlist_blacklisted(playlist_id):
+    if BLACKLIST_INDEX is not None:
+        return playlist_id in BLACKLIST_INDEX.playlists
     rows = db_query("SELECT blacklisted FROM user_playlists WHERE playlist_id = %s LIMIT 1", (playlist_id,), fetch=True)
     if not rows:
         return False
     return bool(rows[0].get("blacklisted"))
 
 def add_or_update_user_playlist(playlist_id, name=None, blacklisted=False):
-    conn = get_db_conn()
-    if not conn:
+    if blacklisted and BLACKLIST_INDEX is not None:
+        BLACKLIST_INDEX.add_playlist(playlist_id)
+    if not db_enabled():
         return
     try:
         # upsert-like behavior
@@ -72,21 +289,27 @@ def add_or_update_user_playlist(playlist_id, name=None, blacklisted=False):
             pass
 
 def mark_playlist_blacklisted(playlist_id):
+    if BLACKLIST_INDEX is not None:
+        BLACKLIST_INDEX.add_playlist(playlist_id)
     db_query("UPDATE user_playlists SET blacklisted = TRUE WHERE playlist_id = %s", (playlist_id,))
 
 def is_track_blacklisted(song_id):
+    if BLACKLIST_INDEX is not None:
+        return song_id in BLACKLIST_INDEX.songs
     rows = db_query("SELECT 1 FROM blacklisted_songs WHERE song_id = %s LIMIT 1", (song_id,), fetch=True)
     return bool(rows)
 
 def blacklisted_artist_count(artist_id):
+    if BLACKLIST_INDEX is not None:
+        return BLACKLIST_INDEX.artist_song_counts.get(artist_id, 0)
     rows = db_query("SELECT COUNT(*) AS c FROM blacklisted_songs WHERE artist_id = %s", (artist_id,), fetch=True)
     if not rows:
         return 0
     return int(rows[0].get("c", 0) or 0)
 
 def add_blacklisted_song(song_id, song_name=None, artist_id=None, artist_name=None):
-    conn = get_db_conn()
-    if not conn:
+    remember_blacklisted_song(song_id, artist_id)
+    if not db_enabled():
         return
     try:
         db_query("INSERT INTO blacklisted_songs (song_id, song_name, artist_id, artist_name) VALUES (%s,%s,%s,%s)",
@@ -98,4 +321,317 @@ def get_random_whitelisted_profile():
     rows = db_query("SELECT profile_id FROM whitelisted_user_profiles", fetch=True)
     if not rows:
         return None
-    return random.choice(rows)[0]
\ No newline at end of file
+    return random.choice(rows)[0]
+
+# ---- Spotify read-response cache ----
+def ensure_spotify_cache_table():
+    db_query("""
+        CREATE TABLE IF NOT EXISTS spotify_response_cache (
+            cache_key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            response JSONB NOT NULL,
+            fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_accessed TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """)
+    db_query("CREATE INDEX IF NOT EXISTS spotify_response_cache_last_accessed ON spotify_response_cache (last_accessed)")
+
+# cache keys read this run; their LRU timestamps are bumped in one statement by touch_spotify_cache()
+_touched_cache_keys = set()
+_touched_cache_lock = threading.Lock()
+
+def get_cached_spotify_response(cache_key, ttl_seconds):
+    """Return the cached response if younger than ttl_seconds, else None. Hits are touched in bulk later."""
+    rows = db_query("""
+        SELECT response FROM spotify_response_cache
+        WHERE cache_key = %s AND fetched_at > NOW() - make_interval(secs => %s)
+        """, (cache_key, ttl_seconds), fetch=True)
+    if not rows:
+        return None
+    with _touched_cache_lock:
+        _touched_cache_keys.add(cache_key)
+    return rows[0][0]
+
+def store_cached_spotify_response(cache_key, endpoint, response):
+    db_query("""
+        INSERT INTO spotify_response_cache (cache_key, endpoint, response, fetched_at, last_accessed)
+        VALUES (%s, %s, %s, NOW(), NOW())
+        ON CONFLICT (cache_key) DO UPDATE
+        SET response = EXCLUDED.response, fetched_at = NOW(), last_accessed = NOW()
+        """, (cache_key, endpoint, psycopg2.extras.Json(response)))
+
+def touch_spotify_cache():
+    """Bump last_accessed for every entry read since the last call, in one statement."""
+    with _touched_cache_lock:
+        keys = sorted(_touched_cache_keys)
+        _touched_cache_keys.clear()
+    if keys:
+        db_query("UPDATE spotify_response_cache SET last_accessed = NOW() WHERE cache_key = ANY(%s)", (keys,))
+
+def prune_spotify_cache(ttls, max_entries):
+    """Drop expired entries per endpoint, then evict least-recently-used rows beyond max_entries."""
+    # entries read this run must count as recently used before the LRU cut
+    touch_spotify_cache()
+    for endpoint, ttl_seconds in ttls.items():
+        db_query("DELETE FROM spotify_response_cache WHERE endpoint = %s AND fetched_at <= NOW() - make_interval(secs => %s)",
+                 (endpoint, ttl_seconds))
+    db_query("""
+        DELETE FROM spotify_response_cache WHERE cache_key IN (
+            SELECT cache_key FROM spotify_response_cache ORDER BY last_accessed DESC OFFSET %s
+        )
+        """, (max_entries,))
+
+
+# ---- Sync watermarks ----
+def ensure_sync_state_table():
+    db_query("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """)
+
+def get_sync_state(key):
+    rows = db_query("SELECT value FROM sync_state WHERE key = %s", (key,), fetch=True)
+    if not rows:
+        return None
+    return rows[0][0]
+
+def set_sync_state(key, value):
+    db_query("""
+        INSERT INTO sync_state (key, value, updated_at) VALUES (%s, %s, NOW())
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = NOW()
+        """, (key, str(value)))
+
+
+# ---- Last.fm scrobble store ----
+def ensure_scrobbles_table():
+    ensure_sync_state_table()
+    db_query("""
+        CREATE TABLE IF NOT EXISTS lastfm_scrobbles (
+            username TEXT NOT NULL,
+            uts BIGINT NOT NULL,
+            artist TEXT NOT NULL,
+            track TEXT NOT NULL,
+            PRIMARY KEY (username, uts, artist, track)
+        )
+        """)
+
+def store_scrobbles(username, scrobbles):
+    """Insert (uts, artist, track) tuples, ignoring ones already stored. Returns True on success."""
+    if not scrobbles:
+        return True
+    return db_execute_values(
+        """
+        INSERT INTO lastfm_scrobbles (username, uts, artist, track) VALUES %s
+        ON CONFLICT DO NOTHING
+        """,
+        [(username, uts, artist, track) for uts, artist, track in scrobbles],
+    )
+
+def load_scrobbles(username, since_uts):
+    """Return [(uts, artist, track)] newer than since_uts, oldest first, or None on failure."""
+    rows = db_query(
+        "SELECT uts, artist, track FROM lastfm_scrobbles WHERE username = %s AND uts >= %s ORDER BY uts",
+        (username, since_uts), fetch=True)
+    if rows is None:
+        return None
+    return [(int(r[0]), r[1], r[2]) for r in rows]
+
+def prune_scrobbles(username, before_uts):
+    db_query("DELETE FROM lastfm_scrobbles WHERE username = %s AND uts < %s", (username, before_uts))
+
+
+# ---- Liked-artist counters ----
+def upsert_user_artist_counts(artist_counts, replace=False):
+    """
+    Bulk upsert {artist_id: {"name", "total_liked"}} into user_artists.
+    replace=True stores the counts as totals; otherwise they are added to the stored totals.
+    Returns True on success.
+    """
+    rows = [(aid, info.get("name") or "", int(info.get("total_liked") or 0)) for aid, info in artist_counts.items() if aid]
+    if not rows:
+        return True
+    total_expr = "EXCLUDED.total_liked" if replace else "COALESCE(user_artists.total_liked, 0) + EXCLUDED.total_liked"
+    return db_execute_values(
+        f"""
+        INSERT INTO user_artists (artist_id, artist_name, total_liked) VALUES %s
+        ON CONFLICT (artist_id) DO UPDATE
+        SET artist_name = COALESCE(NULLIF(EXCLUDED.artist_name, ''), user_artists.artist_name),
+            total_liked = {total_expr}
+        """,
+        rows,
+    )
+
+
+# ---- Scraped artist playlists ----
+def ensure_artist_playlists_table():
+    db_query("""
+        CREATE TABLE IF NOT EXISTS artist_playlists_cache (
+            artist_id TEXT PRIMARY KEY,
+            playlists JSONB NOT NULL,
+            scraped_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """)
+
+def get_cached_artist_playlists(artist_id, ttl_seconds):
+    """Return the stored [{name, url}] list for artist_id if scraped within ttl_seconds, else None."""
+    rows = db_query("""
+        SELECT playlists FROM artist_playlists_cache
+        WHERE artist_id = %s AND scraped_at > NOW() - make_interval(secs => %s)
+        """, (artist_id, ttl_seconds), fetch=True)
+    if not rows:
+        return None
+    return rows[0][0]
+
+def store_artist_playlists(artist_id, playlists):
+    db_query("""
+        INSERT INTO artist_playlists_cache (artist_id, playlists, scraped_at) VALUES (%s, %s, NOW())
+        ON CONFLICT (artist_id) DO UPDATE SET playlists = EXCLUDED.playlists, scraped_at = NOW()
+        """, (artist_id, psycopg2.extras.Json(playlists)))
+
+
+# ---- Playlist contents keyed by snapshot_id ----
+def ensure_playlist_snapshots_table():
+    db_query("""
+        CREATE TABLE IF NOT EXISTS playlist_snapshots (
+            playlist_id TEXT PRIMARY KEY,
+            snapshot_id TEXT NOT NULL,
+            items JSONB NOT NULL,
+            partial BOOLEAN NOT NULL DEFAULT FALSE,
+            total INTEGER,
+            fetched_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            last_accessed TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """)
+    # tables created before pruning / first-page storage existed lack these columns
+    db_query("ALTER TABLE playlist_snapshots ADD COLUMN IF NOT EXISTS last_accessed TIMESTAMPTZ NOT NULL DEFAULT NOW()")
+    db_query("ALTER TABLE playlist_snapshots ADD COLUMN IF NOT EXISTS partial BOOLEAN NOT NULL DEFAULT FALSE")
+    db_query("ALTER TABLE playlist_snapshots ADD COLUMN IF NOT EXISTS total INTEGER")
+
+def get_playlist_snapshot(playlist_id, snapshot_id):
+    """
+    Return (items, partial, total) stored for playlist_id if they were saved at snapshot_id,
+    else None. partial is True when only the first page of the playlist was stored;
+    total is the playlist length Spotify reported (None for rows stored without it).
+    """
+    rows = db_query("""
+        UPDATE playlist_snapshots SET last_accessed = NOW()
+        WHERE playlist_id = %s AND snapshot_id = %s
+        RETURNING items, partial, total
+        """, (playlist_id, snapshot_id), fetch=True)
+    if not rows:
+        return None
+    return rows[0][0], bool(rows[0][1]), rows[0][2]
+
+def store_playlist_snapshot(playlist_id, snapshot_id, items, partial=False, total=None):
+    db_query("""
+        INSERT INTO playlist_snapshots (playlist_id, snapshot_id, items, partial, total, fetched_at, last_accessed)
+        VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
+        ON CONFLICT (playlist_id) DO UPDATE
+        SET snapshot_id = EXCLUDED.snapshot_id, items = EXCLUDED.items, partial = EXCLUDED.partial,
+            total = EXCLUDED.total, fetched_at = NOW(), last_accessed = NOW()
+        """, (playlist_id, snapshot_id, psycopg2.extras.Json(items), partial, total))
+
+def prune_playlist_snapshots(ttl_seconds, max_entries):
+    """Drop snapshots fetched more than ttl_seconds ago, then evict least-recently-used rows beyond max_entries."""
+    db_query("DELETE FROM playlist_snapshots WHERE fetched_at <= NOW() - make_interval(secs => %s)", (ttl_seconds,))
+    db_query("""
+        DELETE FROM playlist_snapshots WHERE playlist_id IN (
+            SELECT playlist_id FROM playlist_snapshots ORDER BY last_accessed DESC OFFSET %s
+        )
+        """, (max_entries,))
+
+
+# ---- Similar-artist graph (Last.fm getsimilar + Spotify related-artists) ----
+def ensure_similar_artists_tables():
+    db_query("""
+        CREATE TABLE IF NOT EXISTS similar_artist_edges (
+            artist_key TEXT NOT NULL,
+            neighbor_key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            neighbor_name TEXT NOT NULL,
+            neighbor_id TEXT,
+            weight REAL NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (artist_key, neighbor_key, source)
+        )
+        """)
+    # one row per (artist, source) fetch, so artists without neighbours aren't refetched every run
+    db_query("""
+        CREATE TABLE IF NOT EXISTS similar_artist_refresh (
+            artist_key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (artist_key, source)
+        )
+        """)
+
+def load_similar_artists(artist_keys):
+    """
+    Return ({artist_key: [(neighbor_key, neighbor_name, neighbor_id, weight, source)]},
+            {(artist_key, source): refreshed_at}) for the given keys.
+    """
+    edges = {}
+    refreshed = {}
+    keys = list(set(artist_keys))
+    if not keys:
+        return edges, refreshed
+    rows = db_query("""
+        SELECT artist_key, neighbor_key, neighbor_name, neighbor_id, weight, source
+        FROM similar_artist_edges WHERE artist_key = ANY(%s)
+        """, (keys,), fetch=True) or []
+    for r in rows:
+        edges.setdefault(r[0], []).append((r[1], r[2], r[3], float(r[4]), r[5]))
+    rows = db_query("SELECT artist_key, source, refreshed_at FROM similar_artist_refresh WHERE artist_key = ANY(%s)",
+                    (keys,), fetch=True) or []
+    for r in rows:
+        refreshed[(r[0], r[1])] = r[2]
+    return edges, refreshed
+
+def store_similar_artists(artist_key, source, neighbors):
+    """
+    Replace artist_key's edges from `source` with neighbors [(neighbor_key, name, id, weight)]
+    and mark the pair refreshed, in one transaction. Returns True on success.
+    """
+    # one row per neighbour: a single INSERT ... ON CONFLICT can't touch the same key twice
+    best = {}
+    for k, name, nid, weight in neighbors:
+        if k not in best or weight > best[k][2]:
+            best[k] = (name, nid, weight)
+    rows = [(artist_key, k, source, name, nid, weight) for k, (name, nid, weight) in best.items()]
+    return cassette.call("db", "store_similar_artists", [artist_key, source, len(rows)],
+                         lambda: _store_similar_artists(artist_key, source, rows), default=False)
+
+def _store_similar_artists(artist_key, source, rows):
+    with db_connection() as conn:
+        if not conn:
+            return False
+        # readers must never see the edges deleted but not yet re-inserted
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM similar_artist_edges WHERE artist_key = %s AND source = %s", (artist_key, source))
+                if rows:
+                    psycopg2.extras.execute_values(cur, """
+                        INSERT INTO similar_artist_edges (artist_key, neighbor_key, source, neighbor_name, neighbor_id, weight, refreshed_at)
+                        VALUES %s
+                        ON CONFLICT (artist_key, neighbor_key, source) DO UPDATE
+                        SET neighbor_name = EXCLUDED.neighbor_name, neighbor_id = EXCLUDED.neighbor_id,
+                            weight = EXCLUDED.weight, refreshed_at = NOW()
+                        """, rows, template="(%s, %s, %s, %s, %s, %s, NOW())")
+                cur.execute("""
+                    INSERT INTO similar_artist_refresh (artist_key, source, refreshed_at) VALUES (%s, %s, NOW())
+                    ON CONFLICT (artist_key, source) DO UPDATE SET refreshed_at = NOW()
+                    """, (artist_key, source))
+            conn.commit()
+            return True
+        except Exception as e:
+            print(f"[DB] similar-artist store failed for {artist_key} ({source}): {e}")
+            if not conn.closed:
+                conn.rollback()
+            return False
+        finally:
+            if not conn.closed:
+                conn.autocommit = True
@@ -0,0 +1,479 @@
+"""
+Local stand-in for the Spotify Web API, Spotify accounts service, Last.fm API and
+the open.spotify.com artist playlist pages, backed by a generated catalog.
+
+    python fake_api.py --port 8765 --latency-ms 80 --rate-429 0.05 --rate-5xx 0.01
+
+prints the env vars that point script.py at it. With --load-test N it instead starts
+the server in-process and runs select_track_for_artist for N catalog artists with
+--workers threads, then prints telemetry and server-side request stats.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "ven", "tor", "sil", "da", "mer", "no", "zu", "bel",
+              "cor", "fi", "an", "ye", "gal", "ro", "shi", "pa", "lux", "nim", "ore", "qui"]
+_PLAYLIST_WORDS = ["radio", "mix", "vibes", "essentials", "deep cuts", "late night", "discoveries", "rotation"]
+
+def _fake_id(kind, n):
+    # base62 and 22 chars long, like real Spotify ids
+    return f"{kind}{n:021d}"
+
+class FakeCatalog:
+    """
+    Deterministic synthetic catalog: artists on a ring (related artists are ring
+    neighbours), their tracks, user playlists built around an artist's
+    neighbourhood, liked tracks and a year of scrobbles.
+    """
+
+    def __init__(self, n_artists=2000, tracks_per_artist=10, n_playlists=3000, n_users=50,
+                 n_liked=500, n_scrobbles=5000, seed=42):
+        rng = random.Random(seed)
+        self._lock = threading.Lock()
+        now = int(time.time())
+
+        self.artists = []
+        self.artist_by_id = {}
+        self.artists_by_name = defaultdict(list)
+        names = set()
+        for i in range(n_artists):
+            name = ""
+            while not name or name in names:
+                name = " ".join("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+                                for _ in range(rng.randint(1, 2)))
+            names.add(name)
+            aid = _fake_id("a", i)
+            artist = {
+                "id": aid,
+                "name": name,
+                "type": "artist",
+                "uri": f"spotify:artist:{aid}",
+                "followers": {"href": None, "total": int(10 ** rng.uniform(1.5, 6.5))},
+                "genres": [],
+                "popularity": rng.randint(0, 100),
+            }
+            self.artists.append(artist)
+            self.artist_by_id[aid] = artist
+            self.artists_by_name[name.lower()].append(artist)
+
+        # related artists: 20 neighbours within +-50 on the ring
+        self.related = {}
+        for i, artist in enumerate(self.artists):
+            window = [(i + d) % n_artists for d in range(-50, 51) if d]
+            self.related[artist["id"]] = [self.artists[j]["id"] for j in rng.sample(window, min(20, len(window)))]
+
+        self.tracks = {}
+        self.tracks_by_artist = defaultdict(list)
+        for i, artist in enumerate(self.artists):
+            for j in range(tracks_per_artist):
+                tid = _fake_id("t", i * tracks_per_artist + j)
+                credits = [artist]
+                if rng.random() < 0.1:
+                    credits.append(self.artist_by_id[rng.choice(self.related[artist["id"]])])
+                self.tracks[tid] = {
+                    "id": tid,
+                    "name": " ".join(rng.choice(_SYLLABLES).title() for _ in range(rng.randint(1, 3))),
+                    "type": "track",
+                    "uri": f"spotify:track:{tid}",
+                    "artists": [{"id": a["id"], "name": a["name"], "type": "artist", "uri": a["uri"]} for a in credits],
+                    "duration_ms": rng.randint(120000, 360000),
+                    "popularity": rng.randint(0, 100),
+                }
+                self.tracks_by_artist[artist["id"]].append(tid)
+
+        self.users = [f"fakeuser{k}" for k in range(n_users)]
+        self.playlists = {}
+        self.playlists_by_artist = defaultdict(list)
+        for k in range(n_playlists):
+            seed_artist = rng.choice(self.artists)
+            pool = [seed_artist["id"]] + self.related[seed_artist["id"]]
+            track_ids = []
+            for _ in range(rng.randint(30, 80)):
+                track_ids.append(rng.choice(self.tracks_by_artist[rng.choice(pool)]))
+            pid = _fake_id("p", k)
+            self.playlists[pid] = {
+                "id": pid,
+                "name": f"{seed_artist['name']} {rng.choice(_PLAYLIST_WORDS)}",
+                "owner": {"id": rng.choice(self.users)},
+                "version": 1,
+                "items": [{"added_at": self._iso(now - rng.randint(0, 365 * 86400)), "track_id": t} for t in track_ids],
+            }
+            for aid in {a["id"] for t in track_ids for a in self.tracks[t]["artists"]}:
+                self.playlists_by_artist[aid].append(pid)
+
+        all_track_ids = list(self.tracks)
+        liked = rng.sample(all_track_ids, min(n_liked, len(all_track_ids)))
+        self.liked = sorted(
+            ({"added_at": self._iso(now - rng.randint(0, 365 * 86400)), "track_id": t} for t in liked),
+            key=lambda it: it["added_at"],
+            reverse=True,
+        )
+        liked_artists = [self.tracks[t]["artists"][0]["id"] for t in liked] or [a["id"] for a in self.artists]
+        self.scrobbles = sorted(
+            ((now - rng.randint(0, 365 * 86400), rng.choice(self.tracks_by_artist[rng.choice(liked_artists)]))
+             for _ in range(n_scrobbles)),
+            reverse=True,
+        )
+
+    @staticmethod
+    def _iso(uts):
+        return datetime.fromtimestamp(uts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    @staticmethod
+    def _page(items, limit, offset):
+        return {"items": items[offset:offset + limit], "limit": limit, "offset": offset, "total": len(items),
+                "next": None if offset + limit >= len(items) else "next"}
+
+    def _playlist(self, pid):
+        # unknown ids (e.g. the output playlist) start out as empty playlists
+        with self._lock:
+            if pid not in self.playlists:
+                self.playlists[pid] = {"id": pid, "name": "Output", "owner": {"id": "me"}, "version": 1, "items": []}
+            return self.playlists[pid]
+
+    def _simple_playlist(self, pl):
+        return {"id": pl["id"], "name": pl["name"], "owner": pl["owner"], "snapshot_id": f"snap{pl['version']}",
+                "tracks": {"total": len(pl["items"])}, "type": "playlist", "uri": f"spotify:playlist:{pl['id']}"}
+
+    # ---- Spotify ----
+    def search(self, q, type_, limit, offset):
+        q = (q or "").strip().lower()
+        if type_ == "playlist":
+            pids = []
+            for artist in self.artists_by_name.get(q, []):
+                pids.extend(self.playlists_by_artist[artist["id"]])
+            pids += [pid for pid, pl in self.playlists.items() if q and q in pl["name"].lower() and pid not in pids]
+            return {"playlists": self._page([self._simple_playlist(self.playlists[p]) for p in pids], limit, offset)}
+        matches = list(self.artists_by_name.get(q, []))
+        matches += [a for a in self.artists if q and q in a["name"].lower() and a not in matches]
+        return {"artists": self._page(matches, limit, offset)}
+
+    def artist(self, aid):
+        return self.artist_by_id.get(aid)
+
+    def top_tracks(self, aid):
+        if aid not in self.artist_by_id:
+            return None
+        return {"tracks": [self.tracks[t] for t in self.tracks_by_artist[aid]]}
+
+    def related_artists(self, aid):
+        if aid not in self.artist_by_id:
+            return None
+        return {"artists": [self.artist_by_id[r] for r in self.related[aid]]}
+
+    def playlist(self, pid):
+        pl = self._playlist(pid)
+        with self._lock:
+            return self._simple_playlist(pl)
+
+    def playlist_items(self, pid, limit, offset):
+        pl = self._playlist(pid)
+        with self._lock:
+            items = [{"added_at": it["added_at"], "track": self.tracks.get(it["track_id"]) or {"id": it["track_id"], "artists": []}}
+                     for it in pl["items"][offset:offset + limit]]
+            page = self._page(items, limit, 0)
+            page.update(offset=offset, total=len(pl["items"]))
+            return page
+
+    def add_items(self, pid, uris):
+        pl = self._playlist(pid)
+        now = self._iso(int(time.time()))
+        with self._lock:
+            pl["items"].extend({"added_at": now, "track_id": u.split(":")[-1]} for u in uris)
+            pl["version"] += 1
+            return {"snapshot_id": f"snap{pl['version']}"}
+
+    def remove_items(self, pid, uris):
+        pl = self._playlist(pid)
+        ids = {u.split(":")[-1] for u in uris}
+        with self._lock:
+            pl["items"] = [it for it in pl["items"] if it["track_id"] not in ids]
+            pl["version"] += 1
+            return {"snapshot_id": f"snap{pl['version']}"}
+
+    def saved_tracks(self, limit, offset):
+        items = [{"added_at": it["added_at"], "track": self.tracks[it["track_id"]]} for it in self.liked[offset:offset + limit]]
+        page = self._page(items, limit, 0)
+        page.update(offset=offset, total=len(self.liked), next=None if offset + limit >= len(self.liked) else "next")
+        return page
+
+    def user_playlists(self, user, limit, offset):
+        pls = [self._simple_playlist(pl) for pl in self.playlists.values() if pl["owner"]["id"] == user]
+        return self._page(pls, limit, offset)
+
+    def artist_page_html(self, aid):
+        if aid not in self.artist_by_id:
+            return None
+        links = "".join(f'<div><a href="/playlist/{pid}">{self.playlists[pid]["name"]}</a></div>'
+                        for pid in self.playlists_by_artist[aid][:30])
+        return f"<html><body><h1>{self.artist_by_id[aid]['name']}</h1>{links}</body></html>"
+
+    # ---- Last.fm ----
+    def recent_tracks(self, page, limit, from_uts=None, to_uts=None):
+        rows = [(uts, t) for uts, t in self.scrobbles
+                if (from_uts is None or uts >= from_uts) and (to_uts is None or uts <= to_uts)]
+        total_pages = max(1, (len(rows) + limit - 1) // limit)
+        tracks = []
+        for uts, tid in rows[(page - 1) * limit:page * limit]:
+            track = self.tracks[tid]
+            tracks.append({"artist": {"#text": track["artists"][0]["name"]}, "name": track["name"],
+                           "date": {"uts": str(uts), "#text": self._iso(uts)}})
+        return {"recenttracks": {"track": tracks, "@attr": {"page": str(page), "perPage": str(limit),
+                                                            "totalPages": str(total_pages), "total": str(len(rows))}}}
+
+    def similar_artists(self, name, limit):
+        matches = self.artists_by_name.get((name or "").strip().lower())
+        if not matches:
+            return {"error": 6, "message": "The artist you supplied could not be found"}
+        aid = matches[0]["id"]
+        return {"similarartists": {"artist": [{"name": self.artist_by_id[r]["name"], "match": str(round(1 - i / 20, 3))}
+                                              for i, r in enumerate(self.related[aid][:limit])],
+                                   "@attr": {"artist": matches[0]["name"]}}}
+
+class FaultConfig:
+    """Injected latency and failures, applied to every request except the token endpoint."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1, rate_5xx=0.0, max_rps=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_5xx = rate_5xx
+        self.max_rps = max_rps
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def delay(self):
+        with self._lock:
+            jitter = self._rng.gauss(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def fault(self):
+        """Return an HTTP status to fail with, or None."""
+        with self._lock:
+            if self.max_rps:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start, self._window_count = now, 0
+                self._window_count += 1
+                if self._window_count > self.max_rps:
+                    return 429
+            roll = self._rng.random()
+            if roll < self.rate_429:
+                return 429
+            if roll < self.rate_429 + self.rate_5xx:
+                return self._rng.choice((500, 502, 503))
+        return None
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.stats[(self._route, status)] += 1
+
+    def _error(self, status, message, headers=None):
+        self._send(status, {"error": {"status": status, "message": message}}, headers=headers)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except Exception:
+            return parse_qs(raw.decode())
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        self._route = f"{method} /{'/'.join(parts[:2])}"
+
+        if parts == ["api", "token"]:
+            return self._send(200, {"access_token": "fake-access-token", "token_type": "Bearer",
+                                    "expires_in": 3600, "scope": (body or {}).get("scope", "")})
+
+        time.sleep(self.server.faults.delay())
+        status = self.server.faults.fault()
+        if status == 429:
+            return self._error(429, "API rate limit exceeded", headers={"Retry-After": self.server.faults.retry_after})
+        if status:
+            return self._error(status, "Injected server error")
+
+        catalog = self.server.catalog
+        limit = int(query.get("limit") or 20)
+        offset = int(query.get("offset") or 0)
+        try:
+            if parts[:1] == ["2.0"]:
+                return self._lastfm(catalog, query)
+            if parts[:1] == ["artist"] and len(parts) >= 2:
+                html = catalog.artist_page_html(parts[1])
+                return self._send(200, html, "text/html") if html else self._send(404, "not found", "text/plain")
+            if parts[:1] != ["v1"]:
+                return self._error(404, "Not found")
+            parts = parts[1:]
+            result = self._spotify(catalog, method, parts, query, body, limit, offset)
+        except Exception as e:
+            return self._error(500, f"fake_api error: {e}")
+        if result is None:
+            return self._error(404, "Resource not found")
+        return self._send(200, result)
+
+    def _spotify(self, catalog, method, parts, query, body, limit, offset):
+        if parts == ["search"]:
+            return catalog.search(query.get("q"), query.get("type", "track").split(",")[0], limit, offset)
+        if parts == ["artists"]:
+            return {"artists": [catalog.artist(a) for a in (query.get("ids") or "").split(",") if a]}
+        if parts[:1] == ["artists"] and len(parts) == 2:
+            return catalog.artist(parts[1])
+        if parts[:1] == ["artists"] and len(parts) == 3:
+            if parts[2] == "top-tracks":
+                return catalog.top_tracks(parts[1])
+            if parts[2] == "related-artists":
+                return catalog.related_artists(parts[1])
+        if parts[:1] == ["playlists"] and len(parts) == 2:
+            return catalog.playlist(parts[1])
+        if parts[:1] == ["playlists"] and len(parts) == 3 and parts[2] in ("items", "tracks"):
+            if method == "GET":
+                return catalog.playlist_items(parts[1], min(limit, 100), offset)
+            if method == "POST":
+                uris = body if isinstance(body, list) else (body or {}).get("uris") or []
+                return catalog.add_items(parts[1], uris)
+            if method == "DELETE":
+                entries = (body or {}).get("items") or (body or {}).get("tracks") or []
+                return catalog.remove_items(parts[1], [e["uri"] for e in entries])
+        if parts == ["me", "tracks"]:
+            return catalog.saved_tracks(min(limit, 50), offset)
+        if parts[:1] == ["users"] and parts[2:] == ["playlists"]:
+            return catalog.user_playlists(parts[1], limit, offset)
+        return None
+
+    def _lastfm(self, catalog, query):
+        method = query.get("method")
+        if method == "user.getrecenttracks":
+            to_uts = int(query["to"]) if query.get("to") else None
+            from_uts = int(query["from"]) if query.get("from") else None
+            return self._send(200, catalog.recent_tracks(int(query.get("page") or 1), int(query.get("limit") or 50), from_uts, to_uts))
+        if method == "artist.getsimilar":
+            return self._send(200, catalog.similar_artists(query.get("artist"), int(query.get("limit") or 100)))
+        return self._send(200, {"error": 3, "message": "Invalid Method - No method with that name in this package"})
+
+def start_fake_api(catalog=None, faults=None, host="127.0.0.1", port=0):
+    """Serve in a daemon thread. Returns (server, env) where env points script.py at the server."""
+    server = ThreadingHTTPServer((host, port), FakeApiHandler)
+    server.daemon_threads = True
+    server.catalog = catalog or FakeCatalog()
+    server.faults = faults or FaultConfig()
+    server.stats = Counter()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://{host}:{server.server_address[1]}"
+    env = {
+        "SPOTIFY_API_URL": f"{base}/v1/",
+        "SPOTIFY_ACCOUNTS_URL": base,
+        "SPOTIFY_WEB_URL": base,
+        "LASTFM_API_URL": f"{base}/2.0/",
+    }
+    return server, env
+
+def print_server_stats(server):
+    total = sum(server.stats.values())
+    print(f"[FAKE] {total} requests served")
+    for (route, status), n in sorted(server.stats.items(), key=lambda kv: -kv[1]):
+        print(f"[FAKE]   {n:6d}  {status}  {route}")
+
+def run_load_test(server, env, n_picks, workers, seed=0):
+    """Run the real select_track_for_artist for n_picks catalog artists on `workers` threads."""
+    os.environ.update(env)
+    for key in ("SPOTIFY_CLIENT_ID", "SPOTIFY_CLIENT_SECRET", "SPOTIFY_REFRESH_TOKEN", "LASTFM_API_KEY"):
+        os.environ.setdefault(key, "fake")
+    import script
+    from telemetry import telemetry
+
+    rng = random.Random(seed)
+    picks = rng.sample(server.catalog.artists, min(n_picks, len(server.catalog.artists)))
+    artists_data = script.ArtistRegistry()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        found = list(pool.map(lambda a: script.select_track_for_artist(a["name"], artists_data, set(), artist_id=a["id"]), picks))
+    elapsed = time.monotonic() - start
+    script.close_driver_pool()
+    print(f"[FAKE] {sum(1 for t in found if t)}/{len(picks)} picks found a track in {elapsed:.2f}s with {workers} workers")
+    telemetry.print_summary()
+    print_server_stats(server)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Spotify/Last.fm service for load testing script.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--playlists", type=int, default=3000)
+    parser.add_argument("--liked", type=int, default=500)
+    parser.add_argument("--scrobbles", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 per request")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="probability of a 5xx per request")
+    parser.add_argument("--max-rps", type=int, default=None, help="answer 429 above this many requests per second")
+    parser.add_argument("--load-test", type=int, default=0, metavar="N", help="run select_track_for_artist for N artists and exit")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    catalog = FakeCatalog(n_artists=args.artists, n_playlists=args.playlists, n_liked=args.liked,
+                          n_scrobbles=args.scrobbles, seed=args.seed)
+    faults = FaultConfig(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.rate_5xx,
+                         args.max_rps, seed=args.seed)
+    server, env = start_fake_api(catalog, faults, args.host, 0 if args.load_test else args.port)
+    if args.load_test:
+        run_load_test(server, env, args.load_test, args.workers, seed=args.seed)
+        server.shutdown()
+        return
+
+    print(f"[FAKE] Serving {len(catalog.artists)} artists / {len(catalog.playlists)} playlists; point script.py at it with:")
+    for k, v in env.items():
+        print(f"export {k}={v}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print_server_stats(server)
+
+if __name__ == "__main__":
+    main()
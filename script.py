@@ -1,9 +1,15 @@
 import os
 import json
+import math
 import random
+import sys
 import time
-from datetime import datetime, timezone, timedelta
-from random import choices
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
 import requests
 from spotipy import Spotify
 import spotipy
@@ -17,14 +23,19 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from bs4 import BeautifulSoup
 
-import psycopg2
-import psycopg2.extras
 from urllib.parse import urlparse
 
 # add DB helpers import (new file db_helpers.py)
+from cassette import cassette, VOLATILE_PARAMS
+from telemetry import telemetry
 from db_helpers import (
+    db_enabled,
+    db_query,
+    db_execute_values,
+    close_db_pool,
     is_artist_blacklisted,
     add_blacklisted_artist,
     is_playlist_blacklisted,
@@ -34,20 +45,66 @@ from db_helpers import (
     blacklisted_artist_count,
     add_blacklisted_song,
     get_random_whitelisted_profile,
+    ensure_spotify_cache_table,
+    get_cached_spotify_response,
+    store_cached_spotify_response,
+    prune_spotify_cache,
+    load_blacklist_index,
+    remember_blacklisted_song,
+    get_sync_state,
+    set_sync_state,
+    ensure_sync_state_table,
+    upsert_user_artist_counts,
+    ensure_scrobbles_table,
+    ensure_artist_playlists_table,
+    get_cached_artist_playlists,
+    store_artist_playlists,
+    ensure_playlist_snapshots_table,
+    get_playlist_snapshot,
+    store_playlist_snapshot,
+    prune_playlist_snapshots,
+    ensure_similar_artists_tables,
+    load_similar_artists,
+    store_similar_artists,
+    store_scrobbles,
+    load_scrobbles,
+    prune_scrobbles,
 )
 
 # ==== CONFIG ====
 ARTISTS_FILE = "artists.json"
 OUTPUT_PLAYLIST_ID = os.environ.get("PLAYLIST_ID")  # Spotify playlist to add tracks
 OUTPUT_FILE = "rolled_tracks.json"
+# number of lottery picks worked on concurrently (1 = sequential, original behaviour)
+SELECTION_WORKERS = max(1, int(os.environ.get("SELECTION_WORKERS") or 1))
+if cassette.active:
+    # record/replay must see calls in the same order
+    SELECTION_WORKERS = 1
+
+# persistent cache for read-only Spotify calls: endpoint -> TTL in seconds.
+# Endpoints not listed here (all writes, playlist searches, ...) are never cached.
+SPOTIFY_CACHE_TTLS = {
+    "search:artist": 7 * 86400,
+    "artist_top_tracks": 3 * 86400,
+    "artist_related_artists": 7 * 86400,
+}
+SPOTIFY_CACHE_MAX_ENTRIES = int(os.environ.get("SPOTIFY_CACHE_MAX_ENTRIES") or 50000)
+# stored playlist contents (see get_playlist_contents) are pruned at shutdown
+PLAYLIST_SNAPSHOTS_TTL = int(os.environ.get("PLAYLIST_SNAPSHOTS_TTL_DAYS") or 30) * 86400
+PLAYLIST_SNAPSHOTS_MAX_ENTRIES = int(os.environ.get("PLAYLIST_SNAPSHOTS_MAX_ENTRIES") or 5000)
 
 LASTFM_API_KEY = os.environ.get("LASTFM_API_KEY")
 LASTFM_USERNAME = os.environ.get("LASTFM_USERNAME")
+LASTFM_API_URL = os.environ.get("LASTFM_API_URL") or "http://ws.audioscrobbler.com/2.0/"
 
 SPOTIFY_CLIENT_ID = os.environ.get("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.environ.get("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = (os.environ.get("BASE_URL") or "http://localhost:5000") + "/callback"
 SPOTIFY_REFRESH_TOKEN = os.environ.get("SPOTIFY_REFRESH_TOKEN")
+# base-URL overrides, e.g. to point at fake_api.py for load tests
+SPOTIFY_API_URL = os.environ.get("SPOTIFY_API_URL")
+SPOTIFY_ACCOUNTS_URL = os.environ.get("SPOTIFY_ACCOUNTS_URL")
+SPOTIFY_WEB_URL = (os.environ.get("SPOTIFY_WEB_URL") or "https://open.spotify.com").rstrip("/")
 
 MY_PHONE = os.environ.get("MY_PHONE_NUMBER")
 SELFPING_API_KEY = os.environ.get("SELFPING_API_KEY")
@@ -55,107 +112,589 @@ SELFPING_ENDPOINT = "https://www.selfping.com/api/sms"
 
 scope = "playlist-modify-public playlist-modify-private user-library-read"
 
+# scraped artist playlists are reused for this long before the artist page is scraped again
+ARTIST_PLAYLISTS_TTL = int(os.environ.get("ARTIST_PLAYLISTS_TTL_DAYS") or 14) * 86400
+# similar-artist edges older than this are refreshed in the background when read
+SIMILAR_ARTISTS_TTL = int(os.environ.get("SIMILAR_ARTISTS_TTL_DAYS") or 30) * 86400
+
 # ==== SPOTIFY AUTH ====
-auth_manager = SpotifyOAuth(
-    client_id=SPOTIFY_CLIENT_ID,
-    client_secret=SPOTIFY_CLIENT_SECRET,
-    redirect_uri=SPOTIFY_REDIRECT_URI,
-    scope=scope,
-    cache_path=None
-)
-auth_manager.refresh_access_token(SPOTIFY_REFRESH_TOKEN)
-sp = Spotify(auth_manager=auth_manager)
-
-# ==== GLOBAL DRIVER FOR SCRAPING ====
-global_driver = None
-def get_global_driver():
-    global global_driver
-    if global_driver is None:
-        chrome_bin = os.environ.get("CHROME_BIN")
-        chromedriver_path = os.environ.get("CHROMEDRIVER_PATH")
-
-        options = webdriver.ChromeOptions()
-        if chrome_bin:
-            options.binary_location = chrome_bin
-        # fallback to legacy headless flag if new not supported
+# statuses spotipy's urllib3 adapter retries by itself; 429s are left to
+# safe_spotify_call so the shared spotify_rate_limiter sees them with their Retry-After
+SPOTIFY_TRANSPORT_RETRY_STATUSES = (500, 502, 503, 504)
+
+def _build_spotify_client(**kwargs):
+    client = Spotify(status_forcelist=SPOTIFY_TRANSPORT_RETRY_STATUSES, **kwargs)
+    # urllib3 also retries any 429 carrying Retry-After (sleeping per thread) unless told not to
+    retry = client._session.adapters["https://"].max_retries.new(respect_retry_after_header=False)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    client._session.mount("http://", adapter)
+    client._session.mount("https://", adapter)
+    return client
+
+if cassette.replaying:
+    # every Spotify call is answered by the cassette; sp only names the endpoints
+    sp = _build_spotify_client(auth="cassette-replay")
+else:
+    auth_manager = SpotifyOAuth(
+        client_id=SPOTIFY_CLIENT_ID,
+        client_secret=SPOTIFY_CLIENT_SECRET,
+        redirect_uri=SPOTIFY_REDIRECT_URI,
+        scope=scope,
+        cache_path=None
+    )
+    if SPOTIFY_ACCOUNTS_URL:
+        auth_manager.OAUTH_TOKEN_URL = SPOTIFY_ACCOUNTS_URL.rstrip("/") + "/api/token"
+    auth_manager.refresh_access_token(SPOTIFY_REFRESH_TOKEN)
+    sp = _build_spotify_client(auth_manager=auth_manager)
+if SPOTIFY_API_URL:
+    sp.prefix = SPOTIFY_API_URL.rstrip("/") + "/"
+
+# ==== DRIVER POOL FOR SCRAPING ====
+# each headless Chrome needs a few hundred MB; size the pool to the container's memory
+SCRAPER_POOL_SIZE = max(1, int(os.environ.get("SCRAPER_POOL_SIZE") or 1))
+# restart a driver after this many pages to keep Chrome's memory growth in check
+SCRAPER_MAX_PAGES_PER_DRIVER = max(1, int(os.environ.get("SCRAPER_MAX_PAGES_PER_DRIVER") or 50))
+# fast extraction: block heavy resources, read links in-browser, stop scrolling early (set 0 for the legacy path)
+SCRAPE_FAST_MODE = os.environ.get("SCRAPE_FAST_MODE", "1") != "0"
+# only 2 scraped playlists are ever tried, so stop scrolling once this many candidates are on the page
+SCRAPE_MIN_PLAYLISTS = max(1, int(os.environ.get("SCRAPE_MIN_PLAYLISTS") or 10))
+# URL patterns Chrome refuses to load in fast mode
+SCRAPE_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp3", "*.mp4", "*.m4a", "*.webm",
+    "*i.scdn.co/image*", "*mosaic.scdn.co*",
+]
+
+def create_chrome_driver():
+    chrome_bin = os.environ.get("CHROME_BIN")
+    chromedriver_path = os.environ.get("CHROMEDRIVER_PATH")
+
+    options = webdriver.ChromeOptions()
+    if chrome_bin:
+        options.binary_location = chrome_bin
+    # fallback to legacy headless flag if new not supported
+    try:
+        options.add_argument("--headless=new")
+    except Exception:
+        options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    if SCRAPE_FAST_MODE:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+    # try to use chromedriver-binary if no explicit path provided
+    if not chromedriver_path:
         try:
-            options.add_argument("--headless=new")
+            import chromedriver_binary  # installs and exposes binary_path
+            chromedriver_path = getattr(chromedriver_binary, "binary_path", None)
         except Exception:
-            options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
+            chromedriver_path = None
 
-        # try to use chromedriver-binary if no explicit path provided
-        if not chromedriver_path:
-            try:
-                import chromedriver_binary  # installs and exposes binary_path
-                chromedriver_path = getattr(chromedriver_binary, "binary_path", None)
-            except Exception:
-                chromedriver_path = None
+    if not chromedriver_path:
+        raise RuntimeError("CHROMEDRIVER_PATH (or chromedriver-binary) is required to start the Chrome driver")
 
-        if not chromedriver_path:
-            raise RuntimeError("CHROMEDRIVER_PATH (or chromedriver-binary) is required to start the Chrome driver")
+    service = Service(chromedriver_path)
+    driver = webdriver.Chrome(service=service, options=options)
+    if SCRAPE_FAST_MODE:
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": SCRAPE_BLOCKED_URLS})
+        except Exception as e:
+            print(f"[SCRAPER] Could not enable resource blocking: {e}")
+        driver.set_script_timeout(15)
+    return driver
 
-        service = Service(chromedriver_path)
-        global_driver = webdriver.Chrome(service=service, options=options)
-    return global_driver
+class DriverPool:
+    """
+    Bounded pool of headless Chrome drivers. checkout() blocks while `size` drivers are
+    in use; idle drivers are health-checked before reuse and replaced after max_pages
+    pages or when checked in as broken (crash, dead session).
+    """
 
-def close_global_driver():
-    global global_driver
-    if global_driver:
+    def __init__(self, size=1, max_pages=50, factory=create_chrome_driver):
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        self._idle = []
+        self._pages = {}
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _quit(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
         try:
-            global_driver.quit()
+            driver.quit()
         except Exception:
             pass
-        global_driver = None
+
+    def _healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    driver = self._idle.pop() if self._idle else None
+                if driver is None:
+                    driver = self.factory()
+                    with self._lock:
+                        self._pages[id(driver)] = 0
+                    return driver
+                if self._healthy(driver):
+                    return driver
+                print("[SCRAPER] Idle driver failed health check; replacing it")
+                self._quit(driver)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, driver, broken=False):
+        try:
+            with self._lock:
+                pages = self._pages.get(id(driver), 0) + 1
+                self._pages[id(driver)] = pages
+            if broken or pages >= self.max_pages:
+                self._quit(driver)
+            else:
+                with self._lock:
+                    self._idle.append(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._quit(driver)
+
+driver_pool = DriverPool(size=SCRAPER_POOL_SIZE, max_pages=SCRAPER_MAX_PAGES_PER_DRIVER)
+
+def close_driver_pool():
+    driver_pool.close()
 
 # ==== HELPER FUNCTIONS ====
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every caller of an API.
+    After a 429 the refill rate is halved and all callers are held until
+    Retry-After has passed; each success then nudges the rate back up.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait_s = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_rate_limited(self, retry_after):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = time.monotonic()
+            self.blocked_until = max(self.blocked_until, self.updated + retry_after)
+
+# retry jitter draws from its own generator: retries happen while recording but not on
+# replay, so using the cassette-seeded global random would shift every later draw
+_backoff_rng = random.Random()
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)."""
+    return _backoff_rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+spotify_rate_limiter = TokenBucket(
+    rate=float(os.environ.get("SPOTIFY_MAX_CALLS_PER_SEC") or 5),
+    capacity=float(os.environ.get("SPOTIFY_BURST") or 10),
+)
+
 def safe_spotify_call(func, *args, **kwargs):
-    """Spotify call wrapper with retries, 404 skip, and None fallback."""
+    """Spotify call wrapper with shared rate limiting, retries, 404 skip, and None fallback."""
+    endpoint = getattr(func, "__name__", str(func))
+    result = cassette.call("spotify", endpoint, [args, kwargs], lambda: _safe_spotify_call(func, *args, **kwargs))
+    artist_identity.observe_response(result, endpoint)
+    return result
+
+def _safe_spotify_call(func, *args, **kwargs):
     retries = 3
+    endpoint = getattr(func, "__name__", str(func))
     for attempt in range(retries):
+        if attempt:
+            telemetry.incr("spotify.retries")
+        spotify_rate_limiter.acquire()
+        start = time.monotonic()
         try:
-            time.sleep(0.3)
-            return func(*args, **kwargs)
+            result = func(*args, **kwargs)
+            telemetry.record_call("spotify", endpoint, time.monotonic() - start)
+            spotify_rate_limiter.on_success()
+            return result
         except spotipy.exceptions.SpotifyException as e:
+            telemetry.record_call("spotify", endpoint, time.monotonic() - start, getattr(e, "http_status", None) or "error")
             if getattr(e, "http_status", None) == 404:
                 print(f"[WARN] Spotify 404 for {getattr(func,'__name__',str(func))}: Resource not found")
                 return None
             elif getattr(e, "http_status", None) == 429:
-                retry_after = int(getattr(e, "headers", {}).get("Retry-After", 30))
-                print(f"[RATE LIMIT] Waiting {retry_after}s before retrying {getattr(func,'__name__',str(func))}...")
-                time.sleep(retry_after + 2)
-            elif 500 <= getattr(e, "http_status", 0) < 600:
+                telemetry.incr("spotify.429")
+                retry_after = int((getattr(e, "headers", None) or {}).get("Retry-After", 30))
+                delay = retry_after + backoff_delay(attempt)
+                print(f"[RATE LIMIT] Waiting {delay:.1f}s before retrying {getattr(func,'__name__',str(func))}...")
+                # blocks every thread sharing the limiter until Retry-After has passed
+                spotify_rate_limiter.on_rate_limited(delay)
+            elif 500 <= (getattr(e, "http_status", 0) or 0) < 600:
                 print(f"[WARN] Spotify server error ({getattr(e,'http_status',None)}) on {getattr(func,'__name__',str(func))}, retrying...")
-                time.sleep(2)
+                time.sleep(backoff_delay(attempt))
             else:
                 print(f"[ERROR] Spotify error ({getattr(e,'http_status',None)}) in {getattr(func,'__name__',str(func))}: {e}")
                 return None
         except Exception as e:
+            telemetry.record_call("spotify", endpoint, time.monotonic() - start, "error")
             print(f"[WARN] Unexpected error in {getattr(func,'__name__',str(func))}: {e}")
-            time.sleep(2)
+            time.sleep(backoff_delay(attempt))
+    telemetry.incr("spotify.failed")
     print(f"[FAIL] {getattr(func,'__name__',str(func))} failed after {retries} retries")
     return None
 
-def get_random_track_from_playlist(playlist_id, excluded_artist=None, max_followers=None, source_desc="", artists_data=None, existing_artist_ids=None):
-    consecutive_invalid = 0
-    for attempt in range(1, 21):
-        playlist = safe_spotify_call(
-            sp.playlist_items,
-            playlist_id,
-            fields="items(track(name,id,artists(id,name)))"
-        )
-        if not playlist or "items" not in playlist:
-            print(f"[WARN] Playlist {playlist_id} is empty or inaccessible, skipping")
+spotify_cache_stats = {"hits": 0, "misses": 0}
+_spotify_cache_stats_lock = threading.Lock()
+
+def _spotify_cache_endpoint(func, kwargs):
+    name = getattr(func, "__name__", str(func))
+    if name == "search":
+        return f"search:{kwargs.get('type', 'track')}"
+    return name
+
+def cached_spotify_call(func, *args, **kwargs):
+    """
+    safe_spotify_call with the persistent TTL cache in front of read-only endpoints
+    (see SPOTIFY_CACHE_TTLS). Failed calls (None) are never cached.
+    Never use this for the output playlist or any write call.
+    """
+    endpoint = _spotify_cache_endpoint(func, kwargs)
+    ttl = SPOTIFY_CACHE_TTLS.get(endpoint)
+    if not ttl:
+        return safe_spotify_call(func, *args, **kwargs)
+
+    cache_key = endpoint + ":" + json.dumps([list(args), kwargs], sort_keys=True, default=str)
+    cached = get_cached_spotify_response(cache_key, ttl)
+    if cached is not None:
+        with _spotify_cache_stats_lock:
+            spotify_cache_stats["hits"] += 1
+        artist_identity.observe_response(cached, endpoint)
+        return cached
+
+    with _spotify_cache_stats_lock:
+        spotify_cache_stats["misses"] += 1
+    result = safe_spotify_call(func, *args, **kwargs)
+    if result is not None:
+        store_cached_spotify_response(cache_key, endpoint, result)
+    return result
+
+# ==== ARTIST IDENTITY MAP ====
+class ArtistIdentityMap:
+    """
+    Per-run map of every Spotify artist object seen in any API response:
+    id -> {"id", "name", "followers"} plus a normalized-name index. Follower counts
+    already present in search / related-artists / sp.artists payloads are reused
+    instead of being fetched again. Only artists from NAME_INDEX_ENDPOINTS payloads
+    feed the name index (a playlist track's artist may just share the name), and a
+    name seen with more than one id there is treated as unknown.
+    """
+
+    # search results and related-artists are the only payloads whose names were matched on purpose
+    NAME_INDEX_ENDPOINTS = ("search", "artist_related_artists")
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_name = {}  # normalized name -> {ids}
+        self._missing = set()  # ids sp.artists returned null for (known-missing)
+        self._lock = threading.Lock()
+
+    def observe(self, artist, index_name=False):
+        if not isinstance(artist, dict) or not artist.get("id"):
+            return
+        aid = artist["id"]
+        name = artist.get("name")
+        followers = (artist.get("followers") or {}).get("total") if isinstance(artist.get("followers"), dict) else None
+        with self._lock:
+            entry = self._by_id.setdefault(aid, {"id": aid, "name": None, "followers": None})
+            if name:
+                entry["name"] = name
+                if index_name:
+                    self._by_name.setdefault(name.strip().lower(), set()).add(aid)
+            if followers is not None:
+                try:
+                    entry["followers"] = int(followers)
+                    self._missing.discard(aid)
+                except Exception:
+                    pass
+
+    def observe_response(self, payload, endpoint=None):
+        """
+        Collect artist objects anywhere under an "artists" key (list, or paging object
+        with items). endpoint is the Spotify call the payload came from, if any.
+        """
+        index_names = (endpoint or "").split(":")[0] in self.NAME_INDEX_ENDPOINTS
+        self._observe_payload(payload, index_names)
+
+    def _observe_payload(self, payload, index_names):
+        if isinstance(payload, list):
+            for value in payload:
+                self._observe_payload(value, index_names)
+        elif isinstance(payload, dict):
+            for key, value in payload.items():
+                if key == "artists":
+                    artists = value.get("items") if isinstance(value, dict) else value
+                    for artist in artists or []:
+                        self.observe(artist, index_name=index_names)
+                elif isinstance(value, (dict, list)):
+                    self._observe_payload(value, index_names)
+
+    def get(self, aid):
+        with self._lock:
+            entry = self._by_id.get(aid)
+            return dict(entry) if entry else None
+
+    def find_by_name(self, name):
+        with self._lock:
+            ids = self._by_name.get((name or "").strip().lower())
+            # ambiguous names are resolved by a search, like names never seen
+            if not ids or len(ids) > 1:
+                return None
+            return dict(self._by_id[next(iter(ids))])
+
+    def followers(self, aid):
+        with self._lock:
+            entry = self._by_id.get(aid)
+            return entry["followers"] if entry else None
+
+    def mark_missing(self, aid):
+        """Remember that Spotify had no follower count for aid, so it isn't requested again."""
+        with self._lock:
+            entry = self._by_id.get(aid)
+            if not entry or entry["followers"] is None:
+                self._missing.add(aid)
+
+    def is_missing(self, aid):
+        with self._lock:
+            return aid in self._missing
+
+artist_identity = ArtistIdentityMap()
+
+def resolve_follower_counts(artist_ids):
+    """
+    Return {artist_id: followers} for the given ids. Ids whose follower count hasn't been
+    seen in any response this run are fetched through sp.artists, 50 per request.
+    Ids Spotify can't resolve are omitted and not requested again this run.
+    """
+    wanted = [aid for aid in dict.fromkeys(artist_ids) if aid]
+    missing = [aid for aid in wanted if artist_identity.followers(aid) is None and not artist_identity.is_missing(aid)]
+    for i in range(0, len(missing), 50):
+        batch = missing[i:i + 50]
+        # safe_spotify_call feeds the response into artist_identity
+        res = safe_spotify_call(sp.artists, batch)
+        if res is None:
+            # failed call: nothing learned, try again next time
+            continue
+        for aid in batch:
+            if artist_identity.followers(aid) is None:
+                artist_identity.mark_missing(aid)
+    counts = {}
+    for aid in wanted:
+        followers = artist_identity.followers(aid)
+        if followers is not None:
+            counts[aid] = followers
+    return counts
+
+def get_follower_count(artist_id):
+    return resolve_follower_counts([artist_id]).get(artist_id)
+
+# ==== PLAYLIST CONTENTS (snapshot_id-aware cache) ====
+PLAYLIST_ITEM_FIELDS = "total,items(added_at,track(id,name,artists(id,name)))"
+# the Step 1/2 artist dominance checks and the whitelist pick only look at this many items
+PLAYLIST_FIRST_PAGE = 100
+# playlist_id -> (snapshot_id, items, complete, total) for playlists already resolved in this run
+_playlist_contents_memo = {}
+_playlist_contents_lock = threading.Lock()
+playlist_snapshot_stats = {"hits": 0, "misses": 0}
+
+def _fetch_playlist_pages(playlist_id, page_limit=100, max_pages=None, offset=0):
+    """
+    (items, total) for the pages from offset on, where total is the playlist length
+    Spotify reports. None if any page fails: a partial list must never pass for the
+    whole playlist. Empty slots are kept as track-less items so positions line up.
+    """
+    items = []
+    total = None
+    start = offset
+    while max_pages is None or offset - start < max_pages * page_limit:
+        res = safe_spotify_call(sp.playlist_items, playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=page_limit, offset=offset)
+        if not res or "items" not in res:
+            return None
+        if total is None:
+            total = res.get("total")
+        page = res["items"] or []
+        items.extend({"added_at": (it or {}).get("added_at"), "track": (it or {}).get("track")} for it in page)
+        if len(page) < page_limit:
+            return items, total
+        offset += page_limit
+    return items, total
+
+def get_playlist_contents(playlist_id, reuse_in_run=True, first_page_only=False, snapshot_id=None):
+    """
+    All items ({added_at, track}) of a playlist, or None if it is inaccessible.
+    The playlist's snapshot_id decides whether the copy stored in playlist_snapshots is
+    current; only changed playlists are paged again. Pass snapshot_id when the caller
+    already has it (search and user_playlists results carry it), otherwise one cheap
+    sp.playlist(fields="snapshot_id") call fetches it. With reuse_in_run, a playlist
+    already resolved this run skips even that (don't use it for playlists this run modifies).
+    first_page_only returns just the first PLAYLIST_FIRST_PAGE items and never pages
+    further; the artist dominance thresholds in selection are tuned for that window.
+    Such a first page is stored as partial, and a later full read pages on from it.
+    """
+    if reuse_in_run:
+        with _playlist_contents_lock:
+            memo = _playlist_contents_memo.get(playlist_id)
+        if memo is not None and (memo[2] or first_page_only):
+            return memo[1][:PLAYLIST_FIRST_PAGE] if first_page_only else memo[1]
+        if memo is not None:
+            # first page already fetched this run: page on from where it stopped
+            items = _complete_playlist_contents(playlist_id, memo[0], memo[1])
+            if items is not None:
+                return items
+
+    if not snapshot_id:
+        meta = safe_spotify_call(sp.playlist, playlist_id, fields="snapshot_id")
+        snapshot_id = (meta or {}).get("snapshot_id")
+        if not snapshot_id:
+            return None
+
+    stored = get_playlist_snapshot(playlist_id, snapshot_id)
+    if stored is not None:
+        with _playlist_contents_lock:
+            playlist_snapshot_stats["hits"] += 1
+        items, partial, total = stored
+        artist_identity.observe_response(items)
+        if partial and not first_page_only:
+            return _complete_playlist_contents(playlist_id, snapshot_id, items)
+        complete = not partial
+    else:
+        with _playlist_contents_lock:
+            playlist_snapshot_stats["misses"] += 1
+        if first_page_only:
+            fetched = _fetch_playlist_pages(playlist_id, page_limit=PLAYLIST_FIRST_PAGE, max_pages=1)
+        else:
+            fetched = _fetch_playlist_pages(playlist_id)
+        if fetched is None:
             return None
+        items, total = fetched
+        complete = not first_page_only or len(items) < PLAYLIST_FIRST_PAGE or (total is not None and total <= len(items))
+        # a truncated first page is stored as partial, never as the full playlist
+        store_playlist_snapshot(playlist_id, snapshot_id, items, partial=not complete, total=total)
+
+    with _playlist_contents_lock:
+        _playlist_contents_memo[playlist_id] = (snapshot_id, items, complete, len(items) if complete else total)
+    return items[:PLAYLIST_FIRST_PAGE] if first_page_only else items
+
+def _complete_playlist_contents(playlist_id, snapshot_id, first_page):
+    """Page on after an already-fetched first page; stores and memoizes the full playlist, None on failure."""
+    fetched = _fetch_playlist_pages(playlist_id, offset=len(first_page))
+    if fetched is None:
+        return None
+    items = first_page + fetched[0]
+    store_playlist_snapshot(playlist_id, snapshot_id, items, total=len(items))
+    with _playlist_contents_lock:
+        _playlist_contents_memo[playlist_id] = (snapshot_id, items, True, len(items))
+    return items
 
-        if not playlist["items"]:
-            print(f"[WARN] Playlist {playlist_id} is empty, skipping...")
+def sample_playlist_items(playlist_id, k):
+    """
+    Up to k items drawn uniformly without replacement, or None if the playlist is
+    inaccessible. Offsets are drawn from the playlist's total and only the pages
+    holding them are fetched, unless that would page (nearly) the whole playlist
+    anyway, in which case it is read and stored in full.
+    """
+    first_page = get_playlist_contents(playlist_id, first_page_only=True)
+    if first_page is None:
+        return None
+    with _playlist_contents_lock:
+        memo = _playlist_contents_memo.get(playlist_id)
+    if memo is None or memo[2] or not memo[3]:
+        items = memo[1] if memo is not None and memo[2] else get_playlist_contents(playlist_id)
+        if items is None:
+            return None
+        return random.sample(items, min(k, len(items)))
+
+    total = memo[3]
+    offsets = random.sample(range(total), min(k, total))
+    pages = sorted({o // PLAYLIST_FIRST_PAGE for o in offsets} - {0})
+    if len(pages) >= math.ceil(total / PLAYLIST_FIRST_PAGE) - 1:
+        items = get_playlist_contents(playlist_id)
+        if items is None:
             return None
+        return [items[o] for o in offsets if o < len(items)]
+
+    by_page = {0: first_page}
+    for p in pages:
+        fetched = _fetch_playlist_pages(playlist_id, page_limit=PLAYLIST_FIRST_PAGE, max_pages=1, offset=p * PLAYLIST_FIRST_PAGE)
+        # a page that fails (or a playlist that shrank) just contributes fewer candidates
+        by_page[p] = fetched[0] if fetched else []
+    sampled = []
+    for o in offsets:
+        page = by_page[o // PLAYLIST_FIRST_PAGE]
+        if o % PLAYLIST_FIRST_PAGE < len(page):
+            sampled.append(page[o % PLAYLIST_FIRST_PAGE])
+    return sampled
 
-        item = random.choice(playlist["items"])
-        track = item.get("track")
+def get_random_track_from_playlist(playlist_id, excluded_artist=None, max_followers=None, source_desc="", artists_data=None, existing_artist_ids=None):
+    # sample without replacement: each item is drawn at most once
+    candidates = sample_playlist_items(playlist_id, 20)
+    if candidates is None:
+        print(f"[WARN] Playlist {playlist_id} is empty or inaccessible, skipping")
+        return None
+    if not candidates:
+        print(f"[WARN] Playlist {playlist_id} is empty, skipping...")
+        return None
+
+    if max_followers:
+        # one sp.artists call per 50 candidate artists instead of one sp.artist per validation
+        resolve_follower_counts(
+            ((it.get("track") or {}).get("artists") or [{}])[0].get("id")
+            for it in candidates if it
+        )
+
+    consecutive_invalid = 0
+    for attempt, item in enumerate(candidates, start=1):
+        track = (item or {}).get("track")
         if not track or "id" not in track or track.get("id") is None:
             print(f"[WARN] Skipping track without ID in playlist '{source_desc}'")
             continue
@@ -176,57 +715,375 @@ def get_random_track_from_playlist(playlist_id, excluded_artist=None, max_follow
             if consecutive_invalid >= 5:
                 print(f"[INFO] 5 consecutive invalid tracks found in playlist '{source_desc}', breaking out")
                 return None
+    return None
 
 def scrape_artist_playlists(artist_id_or_url):
-    driver = get_global_driver()
-    playlists = []
+    return cassette.call("scrape", "artist_playlists", [artist_id_or_url], lambda: _scrape_with_pooled_driver(artist_id_or_url), default=[])
+
+def _scrape_with_pooled_driver(artist_id_or_url):
     try:
-        if "open.spotify.com/artist/" in artist_id_or_url:
-            url = f"{artist_id_or_url}/playlists"
-        else:
-            url = f"https://open.spotify.com/artist/{artist_id_or_url}/playlists"
-        driver.get(url)
+        driver = driver_pool.checkout()
+    except Exception as e:
+        print(f"[WARN] Could not start Chrome driver for scraping: {e}")
+        return []
+    broken = False
+    try:
+        return _scrape_artist_playlists(driver, artist_id_or_url)
+    except TimeoutException as e:
+        print(f"[WARN] Timed out scraping artist playlists: {e}")
+        return []
+    except Exception as e:
+        # anything else (crashed tab, dead session) retires the driver
+        print(f"[WARN] Error scraping artist playlists: {e}")
+        broken = True
+        return []
+    finally:
+        driver_pool.checkin(driver, broken=broken)
+
+def scrape_many_artist_playlists(artist_ids):
+    """Scrape several artists at once, one pooled driver each. Returns {artist_id: playlists}."""
+    with ThreadPoolExecutor(max_workers=SCRAPER_POOL_SIZE) as pool:
+        return dict(zip(artist_ids, pool.map(scrape_artist_playlists, artist_ids)))
+
+# returns [[href, name], ...] for unique playlist anchors, in page order
+_PLAYLIST_LINKS_JS = """
+const seen = new Set();
+const out = [];
+for (const a of document.querySelectorAll("a[href*='/playlist/']")) {
+    const href = a.getAttribute("href");
+    const name = (a.textContent || "").trim();
+    if (href && name && !seen.has(href)) {
+        seen.add(href);
+        out.push([href, name]);
+    }
+}
+return out;
+"""
+
+# resolves with the playlist-anchor count once it grows past arguments[0], or after arguments[1] ms
+_WAIT_FOR_MORE_LINKS_JS = """
+const before = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const count = () => document.querySelectorAll("a[href*='/playlist/']").length;
+if (count() > before) { done(count()); return; }
+const observer = new MutationObserver(() => {
+    if (count() > before) { observer.disconnect(); clearTimeout(timer); done(count()); }
+});
+observer.observe(document.body, {childList: true, subtree: true});
+const timer = setTimeout(() => { observer.disconnect(); done(count()); }, timeoutMs);
+"""
+
+def _playlist_url(href):
+    return href if href.startswith("http") else SPOTIFY_WEB_URL + href
+
+def _scrape_artist_playlists_fast(driver, url, min_playlists=SCRAPE_MIN_PLAYLISTS):
+    """Fast mode: read links with one JS query and scroll only until min_playlists are on the page."""
+    driver.get(url)
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "a[href*='/playlist/']"))
+    )
+    links = driver.execute_script(_PLAYLIST_LINKS_JS) or []
+    while len(links) < min_playlists:
+        before = driver.execute_script("return document.querySelectorAll(\"a[href*='/playlist/']\").length")
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        after = driver.execute_async_script(_WAIT_FOR_MORE_LINKS_JS, before, 3000)
+        if not after or after <= before:
+            break
+        links = driver.execute_script(_PLAYLIST_LINKS_JS) or []
+    return [{"name": name, "url": _playlist_url(href)} for href, name in links]
 
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/playlist/']"))
-        )
+def _scrape_artist_playlists(driver, artist_id_or_url):
+    """Load the artist's playlists page and collect playlist links. Exceptions propagate to the caller."""
+    playlists = []
+    if "/artist/" in artist_id_or_url:
+        url = f"{artist_id_or_url}/playlists"
+    else:
+        url = f"{SPOTIFY_WEB_URL}/artist/{artist_id_or_url}/playlists"
+    if SCRAPE_FAST_MODE:
+        return _scrape_artist_playlists_fast(driver, url)
+    driver.get(url)
+
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/playlist/']"))
+    )
+    time.sleep(2)
+
+    last_height = driver.execute_script("return document.body.scrollHeight")
+    while True:
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         time.sleep(2)
+        new_height = driver.execute_script("return document.body.scrollHeight")
+        if new_height == last_height:
+            break
+        last_height = new_height
+
+    soup = BeautifulSoup(driver.page_source, "html.parser")
+    playlist_elements = soup.select("a[href*='/playlist/']")
+    seen = set()
+    for pl in playlist_elements:
+        href = pl.get("href")
+        name = pl.text.strip()
+        if href and name and href not in seen:
+            playlists.append({"name": name, "url": _playlist_url(href)})
+            seen.add(href)
+    return playlists
+
+def get_artist_playlists(artist_id):
+    """Artist-made playlists from the persistent store; scrapes only on a miss or a stale entry."""
+    cached = get_cached_artist_playlists(artist_id, ARTIST_PLAYLISTS_TTL)
+    if cached is not None:
+        print(f"[CACHE] Using {len(cached)} stored playlists for artist {artist_id}")
+        return cached
+    playlists = scrape_artist_playlists(artist_id)
+    # empty results are usually scrape failures, so they are retried next time instead of stored
+    if playlists:
+        store_artist_playlists(artist_id, playlists)
+    return playlists
+
+# ==== SIMILAR-ARTIST GRAPH ====
+class SimilarArtistGraph:
+    """
+    Artist -> similar-artist adjacency merged from Last.fm artist.getsimilar and Spotify
+    related-artists, persisted in similar_artist_edges. Nodes are keyed by lower-cased
+    name (Last.fm only knows names); Spotify edges also carry the neighbour's id.
+    A source never fetched for the start artist is fetched inline; stale sources, and
+    nodes reached by further hops, are refreshed in the background.
+    """
 
-        last_height = driver.execute_script("return document.body.scrollHeight")
-        while True:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                break
-            last_height = new_height
-
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        playlist_elements = soup.select("a[href*='/playlist/']")
-        seen = set()
-        for pl in playlist_elements:
-            href = pl.get("href")
-            name = pl.text.strip()
-            if href and name and href not in seen:
-                playlists.append({"name": name, "url": "https://open.spotify.com" + href})
-                seen.add(href)
-        return playlists
-    except Exception as e:
-        print(f"[WARN] Error scraping artist playlists: {e}")
-        return playlists
+    SOURCES = ("lastfm", "spotify")
+
+    def __init__(self, ttl_seconds=SIMILAR_ARTISTS_TTL, background_workers=2, max_pending=20):
+        self.ttl_seconds = ttl_seconds
+        # queued + running background refreshes; further requests are dropped and
+        # come back the next time that node is found stale
+        self.max_pending = max_pending
+        self._edges = {}      # key -> [(neighbor_key, name, id, weight, source)]
+        self._refreshed = {}  # (key, source) -> refreshed_at
+        self._loaded = set()
+        self._inflight = set()
+        self._lock = threading.Lock()
+        # background work would make cassette runs order-dependent, so refresh inline there
+        self._pool = None if cassette.active else ThreadPoolExecutor(max_workers=background_workers)
+
+    @staticmethod
+    def key(name):
+        return (name or "").strip().lower()
+
+    def _ensure_loaded(self, keys):
+        with self._lock:
+            missing = [k for k in keys if k not in self._loaded]
+        if not missing:
+            return
+        edges, refreshed = load_similar_artists(missing)
+        with self._lock:
+            for k in missing:
+                if k not in self._loaded:
+                    self._edges[k] = edges.get(k, [])
+                    self._loaded.add(k)
+            for rk, ts in refreshed.items():
+                self._refreshed.setdefault(rk, ts)
+
+    def _fetch(self, source, name, artist_id):
+        """Neighbours of `name` from one source as [(key, name, id, weight)], or None if the request failed."""
+        if source == "lastfm":
+            params = {"method": "artist.getsimilar", "artist": name, "api_key": LASTFM_API_KEY, "format": "json", "limit": 30}
+            try:
+                resp = lastfm_get(params)
+                resp.raise_for_status()
+                data = resp.json()
+            except Exception as e:
+                print(f"[WARN] Failed fetching Last.fm similar artists for {name}: {e}")
+                return None
+            neighbors = []
+            for a in data.get("similarartists", {}).get("artist", []) or []:
+                if not a.get("name"):
+                    continue
+                try:
+                    weight = float(a.get("match") or 0)
+                except (TypeError, ValueError):
+                    weight = 0.0
+                neighbors.append((self.key(a["name"]), a["name"], None, weight))
+            return neighbors
+
+        if not artist_id:
+            known = artist_identity.find_by_name(name)
+            artist_id = known.get("id") if known else None
+        if not artist_id:
+            # no Spotify id to ask with: store it as "no edges" like an empty response,
+            # otherwise every read of this node would queue another no-op refresh
+            return []
+        # related-artists often fails; an empty result is still stored so it isn't retried until the TTL
+        res = cached_spotify_call(sp.artist_related_artists, artist_id)
+        artists = [a for a in ((res or {}).get("artists") or []) if a.get("name")]
+        return [(self.key(a["name"]), a["name"], a.get("id"), 1.0 - i / len(artists)) for i, a in enumerate(artists)]
+
+    def refresh(self, name, artist_id=None, sources=SOURCES):
+        key = self.key(name)
+        self._ensure_loaded([key])
+        for source in sources:
+            neighbors = self._fetch(source, name, artist_id)
+            if neighbors is None:
+                continue
+            neighbors = [n for n in neighbors if n[0] != key]
+            store_similar_artists(key, source, neighbors)
+            with self._lock:
+                kept = [e for e in self._edges.get(key, []) if e[4] != source]
+                self._edges[key] = kept + [(k, n, i, w, source) for k, n, i, w in neighbors]
+                self._refreshed[(key, source)] = cassette.now()
+
+    def _refresh_later(self, name, artist_id, sources):
+        key = self.key(name)
+        with self._lock:
+            if key in self._inflight:
+                return
+            if self._pool is not None and len(self._inflight) >= self.max_pending:
+                telemetry.incr("similar_artists.refresh_dropped")
+                return
+            self._inflight.add(key)
+
+        def run():
+            try:
+                self.refresh(name, artist_id, sources)
+            except Exception as e:
+                print(f"[WARN] Background similar-artist refresh failed for {name}: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.discard(key)
+
+        if self._pool is None:
+            run()
+        else:
+            self._pool.submit(run)
+
+    def neighbors(self, name, artist_id=None, fetch_missing=True):
+        """Merged neighbours of `name` as {key: {"name", "id", "weight"}}; weights from both sources add up."""
+        key = self.key(name)
+        self._ensure_loaded([key])
+        now = cassette.now()
+        missing, stale = [], []
+        with self._lock:
+            for source in self.SOURCES:
+                ts = self._refreshed.get((key, source))
+                if ts is None:
+                    missing.append(source)
+                elif (now - ts).total_seconds() > self.ttl_seconds:
+                    stale.append(source)
+        if missing and fetch_missing:
+            self.refresh(name, artist_id, missing)
+        else:
+            stale += missing
+        if stale:
+            self._refresh_later(name, artist_id, stale)
+
+        with self._lock:
+            edges = list(self._edges.get(key, []))
+        merged = {}
+        for nkey, nname, nid, weight, _source in edges:
+            node = merged.setdefault(nkey, {"name": nname, "id": None, "weight": 0.0})
+            node["weight"] += weight
+            if nid:
+                node["id"] = nid
+        return merged
+
+    def sample(self, name, artist_id=None, k=10, hops=1, exclude=(), rng=random):
+        """
+        Up to k distinct similar artists ({"key", "name", "id", "weight"}) drawn by weighted
+        random walks of up to `hops` steps from `name`. Hops past the first read stored
+        edges only (their refreshes are queued in the background), so on a cold graph a
+        walk stops at the first hop. If the walks come up short of k, the rest is drawn
+        by weight from first-hop neighbours not in `exclude`, so Step 4 still gets
+        untried similar artists until later runs have stored the second-hop edges.
+        """
+        start = self.key(name)
+        first = self.neighbors(name, artist_id)
+        excluded = {start} | {self.key(x) for x in exclude}
+        picked = {}
+        attempts = 0
+        while first and len(picked) < k and attempts < k * 5:
+            attempts += 1
+            current, node = first, None
+            for hop in range(hops):
+                # the last step never lands on an excluded or already picked artist,
+                # so exclusions don't eat into the k candidates
+                skip = excluded | picked.keys() if hop + 1 == hops else {start}
+                choices = [(nk, v) for nk, v in current.items() if v["weight"] > 0 and nk not in skip]
+                if not choices:
+                    break
+                node = rng.choices(choices, weights=[v["weight"] for _, v in choices])[0]
+                if hop + 1 < hops:
+                    current = self.neighbors(node[1]["name"], node[1]["id"], fetch_missing=False)
+            if node and node[0] not in excluded:
+                picked[node[0]] = node[1]
+        if hops > 1 and len(picked) < k:
+            rest = [(nk, v) for nk, v in first.items() if v["weight"] > 0 and nk not in excluded and nk not in picked]
+            # weighted draw without replacement (Efraimidis-Spirakis keys, as in LotterySampler)
+            rest.sort(key=lambda kv: math.log(1.0 - rng.random()) / kv[1]["weight"], reverse=True)
+            for nk, v in rest[:k - len(picked)]:
+                picked[nk] = v
+        return [dict(v, key=nk) for nk, v in picked.items()]
+
+    def close(self):
+        """Drop background refreshes that haven't started; wait for running ones (their DB writes)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+similar_artist_graph = SimilarArtistGraph()
+
+def _track_from_similar_artists(candidates, artists_data, existing_artist_ids, source_desc):
+    """Pick a valid top track from the first suitable candidate artist (< 50k followers)."""
+    resolve_follower_counts([c["id"] for c in candidates if c.get("id")])
+    for cand in candidates:
+        sim_id = cand.get("id")
+        if not sim_id:
+            known = artist_identity.find_by_name(cand["name"])
+            if known:
+                sim_id = known["id"]
+            else:
+                # defensive Spotify search result handling
+                search_res = cached_spotify_call(sp.search, cand["name"], type="artist", limit=1)
+                if not search_res or "artists" not in search_res or not search_res["artists"].get("items"):
+                    continue
+                sim_id = search_res["artists"]["items"][0]["id"]
+        if (get_follower_count(sim_id) or 0) >= 50000:
+            continue
+        top_tracks_resp = cached_spotify_call(sp.artist_top_tracks, sim_id, country="US")
+        top_tracks = top_tracks_resp["tracks"] if top_tracks_resp and "tracks" in top_tracks_resp else []
+        if top_tracks:
+            track = random.choice(top_tracks)
+            is_valid, reason = validate_track(track, artists_data, existing_artist_ids, max_followers=50000)
+            if is_valid:
+                print(f"[INFO] Selected valid track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' from {source_desc}")
+                return track
+            else:
+                print(f"[VALIDATION] Track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' failed: {reason}")
+    return None
+
+def select_track_for_artist(artist_name, artists_data, existing_artist_ids, artist_id=None):
+    """Find one valid track for the rolled artist (Steps 1-4); per-step time goes to telemetry."""
+    track = None
+    try:
+        track = _select_track_for_artist(artist_name, artists_data, existing_artist_ids, artist_id)
+        return track
+    finally:
+        step = telemetry.end_lap()
+        telemetry.incr(f"{step}.{'found' if track else 'exhausted'}")
 
-def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
+def _select_track_for_artist(artist_name, artists_data, existing_artist_ids, artist_id=None):
+    telemetry.lap("selection.step1")
     track = None
     seen_playlists = set()
     playlist_attempts = 0
 
-    # defensive: check search result before indexing
-    search_res = safe_spotify_call(sp.search, artist_name, type="artist", limit=1)
-    if not search_res or "artists" not in search_res or not search_res["artists"].get("items"):
-        print(f"[WARN] No Spotify artist found for '{artist_name}'")
-        return None
-    artist_results = search_res["artists"]["items"]
-    artist_id = artist_results[0]["id"]
+    # the lottery already knows the Spotify id of liked artists; only search by name without one
+    if not artist_id:
+        # defensive: check search result before indexing
+        search_res = cached_spotify_call(sp.search, artist_name, type="artist", limit=1)
+        if not search_res or "artists" not in search_res or not search_res["artists"].get("items"):
+            print(f"[WARN] No Spotify artist found for '{artist_name}'")
+            return None
+        artist_results = search_res["artists"]["items"]
+        artist_id = artist_results[0]["id"]
 
     # If artist is in blacklisted_artists_playlists, skip scraping step
     if is_artist_blacklisted(artist_id):
@@ -234,21 +1091,15 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
         scraped_artist_playlists = []
     else:
         # Step 1: Scraped artist playlists
-        scraped_artist_playlists = scrape_artist_playlists(artist_id)
+        scraped_artist_playlists = get_artist_playlists(artist_id)
     for pl in scraped_artist_playlists:
         playlist_id = pl["url"].split("/")[-1].split("?")[0]
         if playlist_id in seen_playlists:
             continue
         seen_playlists.add(playlist_id)
 
-        playlist_items = safe_spotify_call(
-            sp.playlist_items,
-            playlist_id,
-            limit=100,
-            offset=0,
-            fields="items(track(artists(id,name)))"
-        )
-        if not playlist_items or "items" not in playlist_items:
+        playlist_items = get_playlist_contents(playlist_id, first_page_only=True)
+        if playlist_items is None:
             print(f"[WARN] Spotify 404 or empty playlist_items: {playlist_id}, skipping")
             # mark artist as problematic (irretrievable artist playlist)
             try:
@@ -259,10 +1110,10 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
             break
 
         artist_track_count = 0
-        if playlist_items and isinstance(playlist_items, dict) and "items" in playlist_items:
+        if playlist_items:
             artist_track_count = sum(
                 1
-                for item in playlist_items["items"]
+                for item in playlist_items
                 if item.get("track")
                 and artist_name.lower() in [(a.get("name") or "").lower() for a in item["track"]["artists"] if a.get("name") is not None]
             )
@@ -287,6 +1138,7 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
             return track
 
     # Step 2: User playlists via API (improved & randomized)
+    telemetry.lap("selection.step2")
     print(f"[INFO] No valid tracks found in artist playlists for '{artist_name}'. Trying user made playlists...")
 
     # Gather a randomized candidate set of playlists (avoid repeatedly using the same top results)
@@ -314,8 +1166,6 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
 
             seen_candidate_ids.add(pid)
             candidate_playlists.append(pl)
-        # small pause to be polite / avoid hitting rate-limits on many pages
-        time.sleep(0.15)
         # limit growth if we already gathered enough candidates
         if len(candidate_playlists) >= max_checks * 6:
             break
@@ -339,14 +1189,8 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
                 continue
 
             # fetch playlist items and verify the artist is actually present
-            playlist_data = safe_spotify_call(
-                sp.playlist_items,
-                playlist_id,
-                fields="items(track(artists(id,name)))",
-                limit=100,
-                offset=0
-            )
-            if not playlist_data or "items" not in playlist_data:
+            playlist_items = get_playlist_contents(playlist_id, first_page_only=True, snapshot_id=pl.get("snapshot_id"))
+            if playlist_items is None:
                 print(f"[WARN] Playlist {playlist_id} is empty or inaccessible, marking blacklisted and skipping")
                 try:
                     add_or_update_user_playlist(playlist_id, name=pl.get("name"), blacklisted=True)
@@ -356,7 +1200,6 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
                 continue
 
             # inspect whether this playlist truly contains the artist (prefer id match)
-            playlist_items = playlist_data["items"]
             contains_artist = False
             for item in playlist_items:
                 tr = item.get("track") or {}
@@ -404,127 +1247,201 @@ def select_track_for_artist(artist_name, artists_data, existing_artist_ids):
             if track:
                 return track
 
-    # Step 3: Last.fm similar artists
-    print(f"[INFO] No valid tracks found in scraped/user playlists for '{artist_name}'. Trying Last.fm similar artists...")
-    similar_artists = []
-    url = "http://ws.audioscrobbler.com/2.0/"
-    params = {"method": "artist.getsimilar", "artist": artist_name, "api_key": LASTFM_API_KEY, "format": "json", "limit": 10}
-    try:
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        similar_artists = [a.get("name") for a in data.get("similarartists", {}).get("artist", []) if a.get("name")]
-    except Exception as e:
-        print(f"[WARN] Failed fetching Last.fm similar artists for {artist_name}: {e}")
-        similar_artists = []
-    random.shuffle(similar_artists)
-    for sim_artist in similar_artists[:10]:
-        # defensive Spotify search result handling
-        search_res = safe_spotify_call(sp.search, sim_artist, type="artist", limit=1)
-        if not search_res or "artists" not in search_res or not search_res["artists"].get("items"):
-            continue
-        artist_results = search_res["artists"]["items"]
-        sim_artist_data = artist_results[0]
-        # follower count may be int or string; coerce safely
+    # Step 3: similar artists from the local graph (Last.fm getsimilar + Spotify related-artists)
+    telemetry.lap("selection.step3")
+    print(f"[INFO] No valid tracks found in scraped/user playlists for '{artist_name}'. Trying similar artists...")
+    candidates = similar_artist_graph.sample(artist_name, artist_id, k=10, hops=1)
+    track = _track_from_similar_artists(candidates, artists_data, existing_artist_ids, "similar artists")
+    if track:
+        return track
+
+    # Step 4: similar artists two hops away
+    telemetry.lap("selection.step4")
+    print(f"[INFO] No valid tracks found via similar artists for '{artist_name}'. Trying artists two hops away...")
+    tried = [artist_name] + [c["name"] for c in candidates]
+    candidates = similar_artist_graph.sample(artist_name, artist_id, k=10, hops=2, exclude=tried)
+    return _track_from_similar_artists(candidates, artists_data, existing_artist_ids, "similar artists two hops away")
+
+# ==== LAST.FM TRACKS ====
+# scrobbles older than this are pruned from the local store and ignored by the weights
+SCROBBLE_WINDOW_DAYS = 365
+
+# concurrent page fetches during a backfill; all Last.fm calls share lastfm_rate_limiter
+LASTFM_BACKFILL_WORKERS = max(1, int(os.environ.get("LASTFM_BACKFILL_WORKERS") or 4))
+# fetch the remaining pages concurrently once page 1 reports at least this many pages
+LASTFM_BACKFILL_MIN_PAGES = 3
+lastfm_rate_limiter = TokenBucket(rate=4, capacity=4)
+
+def lastfm_get(params):
+    """Rate-limited, timed GET against the Last.fm API (recorded/replayed by the cassette)."""
+    def fetch():
+        lastfm_rate_limiter.acquire()
+        start = time.monotonic()
+        resp = requests.get(LASTFM_API_URL, params=params)
+        telemetry.record_call("lastfm", params.get("method"), time.monotonic() - start, resp.status_code)
+        if resp.status_code == 429:
+            telemetry.incr("lastfm.429")
+        return resp
+    key = {k: v for k, v in params.items() if k not in VOLATILE_PARAMS}
+    return cassette.call_http("lastfm", params.get("method"), key, fetch)
+
+def _fetch_recent_tracks_page(params, page, retries=4):
+    """GET one user.getrecenttracks page with rate limiting and jittered retries. Raises after the last attempt."""
+    for attempt in range(retries):
+        if attempt:
+            telemetry.incr("lastfm.retries")
+        rate_limited = False
         try:
-            sim_followers = int(sim_artist_data.get("followers", {}).get("total", 0) or 0)
-        except Exception:
-            sim_followers = 0
-        if sim_followers >= 50000:
+            resp = lastfm_get({**params, "page": page})
+            if resp.status_code == 429:
+                # the limiter pauses every Last.fm caller; the next acquire() waits it out
+                rate_limited = True
+                lastfm_rate_limiter.on_rate_limited(backoff_delay(attempt, base=2.0))
+            resp.raise_for_status()
+            lastfm_rate_limiter.on_success()
+            return resp.json()
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"[WARN] Last.fm recent tracks page {page} failed ({e}), retrying...")
+            if not rate_limited:
+                time.sleep(backoff_delay(attempt))
+
+def _parse_recent_tracks(data):
+    tracks = data.get("recenttracks", {}).get("track", [])
+    if isinstance(tracks, dict):
+        # Last.fm returns a bare object instead of a list when there is exactly one scrobble
+        tracks = [tracks]
+    parsed = []
+    for t in tracks:
+        if "@attr" in t and t["@attr"].get("nowplaying") == "true":
             continue
-        top_tracks_resp = safe_spotify_call(sp.artist_top_tracks, sim_artist_data["id"], country="US")
-        top_tracks = top_tracks_resp["tracks"] if top_tracks_resp and "tracks" in top_tracks_resp else []
-        if top_tracks:
-             track = random.choice(top_tracks)
-             is_valid, reason = validate_track(track, artists_data, existing_artist_ids, max_followers=50000)
-             if is_valid:
-                 print(f"[INFO] Selected valid track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' from Last.fm similar artists")
-                 return track
-             else:
-                 print(f"[VALIDATION] Track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' failed: {reason}")
-
-    # Step 4: Spotify similar artists (improved)
-    print(f"[INFO] No valid tracks found via Last.fm for '{artist_name}'. Trying Spotify similar artists...")
-    similar_artists_data = safe_spotify_call(sp.artist_related_artists, artist_id)
-    if not similar_artists_data or "artists" not in similar_artists_data or not similar_artists_data["artists"]:
-        # try to re-resolve artist id via broader search (attempt to handle ambiguous/missed artist ids)
-        print(f"[WARN] Spotify returned no related artists for {artist_name} ({artist_id}). Attempting broader artist lookup and retry.")
-        alt_search = safe_spotify_call(sp.search, artist_name, type="artist", limit=10)
-        if alt_search and "artists" in alt_search and alt_search["artists"].get("items"):
-            # try to pick the best matching artist by exact name match first
-            candidates = alt_search["artists"]["items"]
-            best = None
-            for c in candidates:
-                if (c.get("name") or "").strip().lower() == artist_name.strip().lower():
-                    best = c
-                    break
-            if not best:
-                best = candidates[0]
-            if best and best.get("id") and best.get("id") != artist_id:
-                similar_artists_data = safe_spotify_call(sp.artist_related_artists, best["id"])
-
-    if not similar_artists_data or "artists" not in similar_artists_data:
-        print(f"[WARN] Spotify related-artists not available for '{artist_name}'. Skipping Spotify-similar step.")
-        return None 
-
-    artists_list = similar_artists_data["artists"]
-    random.shuffle(artists_list)
-    for sim_artist_data in artists_list[:10]:
-        # defensive follower/name handling
+        if "date" in t and "uts" in t["date"]:
+            ts = int(t["date"]["uts"])
+            parsed.append({"artist": t["artist"]["#text"].lower(), "track": t["name"], "played_at": datetime.fromtimestamp(ts, tz=timezone.utc)})
+    return parsed
+
+def fetch_recent_tracks_pages(username=LASTFM_USERNAME, api_key=LASTFM_API_KEY, from_uts=None, backfill=False):
+    """
+    Page through user.getrecenttracks. With from_uts only scrobbles at or after that timestamp are fetched.
+    Page 1 reports totalPages; in backfill mode (or for long histories) the remaining pages are fetched
+    concurrently. Failed pages are retried on their own instead of aborting the fetch.
+    Returns (tracks oldest first, complete) where complete is False if some page could not be fetched.
+    """
+    # pin the upper bound so new scrobbles can't shift page boundaries mid-fetch
+    params = {"method": "user.getrecenttracks", "user": username, "api_key": api_key, "format": "json",
+              "limit": 200, "to": int(cassette.now().timestamp())}
+    if from_uts:
+        params["from"] = int(from_uts)
+
+    first = _fetch_recent_tracks_page(params, 1)
+    recent_tracks = _parse_recent_tracks(first)
+    total_pages = int(first.get("recenttracks", {}).get("@attr", {}).get("totalPages", 1) or 1)
+    remaining = list(range(2, total_pages + 1))
+
+    failed = []
+    if remaining and (backfill or total_pages >= LASTFM_BACKFILL_MIN_PAGES):
+        print(f"[INFO] Fetching {len(remaining)} more Last.fm pages with {LASTFM_BACKFILL_WORKERS} workers")
+        with ThreadPoolExecutor(max_workers=LASTFM_BACKFILL_WORKERS) as pool:
+            futures = {pool.submit(_fetch_recent_tracks_page, params, page): page for page in remaining}
+            for fut, page in futures.items():
+                try:
+                    recent_tracks.extend(_parse_recent_tracks(fut.result()))
+                except Exception as e:
+                    print(f"[WARN] Last.fm page {page} failed: {e}")
+                    failed.append(page)
+    else:
+        for page in remaining:
+            try:
+                recent_tracks.extend(_parse_recent_tracks(_fetch_recent_tracks_page(params, page)))
+            except Exception as e:
+                print(f"[WARN] Last.fm page {page} failed: {e}")
+                failed.append(page)
+
+    # second chance for pages that exhausted their retries
+    still_failed = []
+    for page in failed:
         try:
-            sim_followers = int(sim_artist_data.get("followers", {}).get("total", 0) or 0)
-        except Exception:
-            sim_followers = 0
-        sim_name = (sim_artist_data.get("name") or "").lower()
-        if sim_followers >= 50000 or sim_name == artist_name.lower():
-            continue
-        top_tracks_resp = safe_spotify_call(sp.artist_top_tracks, sim_artist_data["id"], country="US")
-        top_tracks = top_tracks_resp["tracks"] if top_tracks_resp and "tracks" in top_tracks_resp else []
-        if top_tracks:
-            track = random.choice(top_tracks)
-            is_valid, reason = validate_track(track, artists_data, existing_artist_ids, max_followers=50000)
-            if is_valid:
-                print(f"[INFO] Selected valid track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' from Spotify similar artists")
-                return track
-            else:
-                print(f"[VALIDATION] Track '{track.get('name')}' by '{(track.get('artists') or [{}])[0].get('name')}' failed: {reason}")
+            recent_tracks.extend(_parse_recent_tracks(_fetch_recent_tracks_page(params, page)))
+        except Exception as e:
+            print(f"[WARN] Giving up on Last.fm page {page}: {e}")
+            still_failed.append(page)
 
-    return None
+    recent_tracks.sort(key=lambda t: t["played_at"])
+    return recent_tracks, not still_failed
 
-# ==== LAST.FM TRACKS ====
-def fetch_all_recent_tracks(username=LASTFM_USERNAME, api_key=LASTFM_API_KEY):
-    recent_tracks = []
-    page = 1
-    while True:
-        params = {"method": "user.getrecenttracks", "user": username, "api_key": api_key, "format": "json", "limit": 200, "page": page}
-        time.sleep(0.25)
-        resp = requests.get("http://ws.audioscrobbler.com/2.0/", params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        tracks = data.get("recenttracks", {}).get("track", [])
-        if not tracks:
-            break
-        for t in tracks:
-            if "@attr" in t and t["@attr"].get("nowplaying") == "true":
-                continue
-            if "date" in t and "uts" in t["date"]:
-                ts = int(t["date"]["uts"])
-                recent_tracks.append({"artist": t["artist"]["#text"].lower(), "track": t["name"], "played_at": datetime.fromtimestamp(ts, tz=timezone.utc)})
-        total_pages = int(data.get("recenttracks", {}).get("@attr", {}).get("totalPages", 1))
-        if page >= total_pages:
-            break
-        page += 1
+def fetch_all_recent_tracks(username=LASTFM_USERNAME, api_key=LASTFM_API_KEY, from_uts=None):
+    """All scrobbles (oldest first); see fetch_recent_tracks_pages."""
+    recent_tracks, _ = fetch_recent_tracks_pages(username, api_key, from_uts=from_uts, backfill=not from_uts)
     return recent_tracks
 
-def build_artist_play_map(recent_tracks, days_limit=365):
-    cutoff = datetime.now(timezone.utc) - timedelta(days=days_limit)
-    artist_play_map = {}
+def sync_recent_tracks(username=LASTFM_USERNAME, api_key=LASTFM_API_KEY, days_limit=SCROBBLE_WINDOW_DAYS):
+    """
+    Incremental scrobble sync: fetch only scrobbles newer than the stored watermark,
+    persist them in lastfm_scrobbles, prune rows outside the weighting window and
+    return the window from the store. Falls back to a full fetch without a DB.
+    """
+    if not db_enabled():
+        return fetch_all_recent_tracks(username, api_key)
+    ensure_scrobbles_table()
+
+    watermark_key = f"lastfm_scrobbles:{username}"
+    cutoff_uts = int(cassette.now().timestamp()) - days_limit * 86400
+    watermark = get_sync_state(watermark_key)
+    try:
+        from_uts = max(int(watermark), cutoff_uts) if watermark else cutoff_uts
+    except ValueError:
+        from_uts = cutoff_uts
+
+    new_tracks, complete = fetch_recent_tracks_pages(username, api_key, from_uts=from_uts, backfill=not watermark)
+    scrobbles = [(int(t["played_at"].timestamp()), t["artist"], t["track"]) for t in new_tracks]
+    if store_scrobbles(username, scrobbles):
+        if not complete:
+            # a page is missing: keep the old watermark so the gap is refetched next run
+            print("[WARN] Some Last.fm pages could not be fetched; watermark not advanced")
+        elif scrobbles:
+            # the boundary second is refetched next time; the primary key drops the duplicates
+            set_sync_state(watermark_key, max(uts for uts, _, _ in scrobbles))
+    else:
+        print("[WARN] Failed to persist new scrobbles; watermark not advanced")
+    prune_scrobbles(username, cutoff_uts)
+
+    stored = load_scrobbles(username, cutoff_uts)
+    if stored is None:
+        print("[WARN] Could not read stored scrobbles; falling back to a full Last.fm fetch")
+        return fetch_all_recent_tracks(username, api_key)
+    print(f"[INFO] Scrobble sync: {len(new_tracks)} new since watermark, {len(stored)} in the {days_limit}-day window")
+    return _scrobble_rows_to_tracks(stored)
+
+def read_recent_tracks(username=LASTFM_USERNAME, api_key=LASTFM_API_KEY, days_limit=SCROBBLE_WINDOW_DAYS):
+    """
+    Read-only counterpart of sync_recent_tracks: the stored window as of the last sync,
+    without fetching new scrobbles or moving the watermark. Falls back to a full
+    Last.fm fetch (nothing stored) when there is no DB or nothing stored yet.
+    """
+    if db_enabled():
+        ensure_scrobbles_table()
+        stored = load_scrobbles(username, int(cassette.now().timestamp()) - days_limit * 86400)
+        if stored:
+            return _scrobble_rows_to_tracks(stored)
+    return fetch_all_recent_tracks(username, api_key)
+
+def _scrobble_rows_to_tracks(rows):
+    return [
+        {"artist": artist, "track": track, "played_at": datetime.fromtimestamp(uts, tz=timezone.utc)}
+        for uts, artist, track in rows
+    ]
+
+def build_artist_play_map(recent_tracks, days_limit=SCROBBLE_WINDOW_DAYS):
+    """artist name (lower) -> sorted array('q') of play timestamps (epoch seconds) within days_limit."""
+    cutoff = cassette.now().timestamp() - days_limit * 86400
+    plays = {}
     for t in recent_tracks:
-        if t["played_at"] < cutoff:
+        ts = int(t["played_at"].timestamp())
+        if ts < cutoff:
             continue
-        artist = t["artist"]
-        artist_play_map.setdefault(artist, []).append(t["played_at"])
-    return artist_play_map
+        plays.setdefault(t["artist"], []).append(ts)
+    return {artist: array("q", sorted(ts_list)) for artist, ts_list in plays.items()}
 
 def validate_track(track, artists_data, existing_artist_ids=None, max_followers=None):
     """
@@ -542,19 +1459,14 @@ def validate_track(track, artists_data, existing_artist_ids=None, max_followers=
         tid = track.get("id")
         if tid and is_track_blacklisted(tid):
             return False, "Track is blacklisted in DB"
-        if aid and blacklisted_artist_count(aid) and blacklisted_artist_count(aid) > 0:
+        if aid and blacklisted_artist_count(aid) > 0:
             return False, f"Artist '{artist.get('name')}' appears in blacklisted_songs"
     except Exception as e:
         # log and continue with other checks (avoid blocking on DB failures)
         print(f"[WARN] validate_track DB blacklist check failed: {e}")
 
     # 1. Blocked by artists.json
-    artist_entry = artists_data.get(aid)
-    if not artist_entry:
-        for k, v in artists_data.items():
-            if (v.get("name") or "").lower() == name_lower:
-                artist_entry = v
-                break
+    artist_entry = artists_data.find(aid, name_lower)
     if artist_entry and int(artist_entry.get("total_liked", 0)) >= 3:
         return False, f"Artist '{artist.get('name')}' blocked by artists.json (total_liked >= 3)"
 
@@ -564,274 +1476,305 @@ def validate_track(track, artists_data, existing_artist_ids=None, max_followers=
 
     # 3. Max followers
     if max_followers:
-        full_artist = safe_spotify_call(sp.artist, aid)
-        if full_artist and full_artist.get("followers", {}).get("total", 0) > max_followers:
-            return False, f"Artist '{artist.get('name')}' has {full_artist.get('followers', {}).get('total', 0)} followers, exceeds max {max_followers}"
+        followers = get_follower_count(aid)
+        if followers is not None and followers > max_followers:
+            return False, f"Artist '{artist.get('name')}' has {followers} followers, exceeds max {max_followers}"
 
     return True, ""
 
-# ---- DB helpers for artist cache (script-level) ----
-def get_db_conn():
-    db_url = os.environ.get("DATABASE_URL")
-    if not db_url:
-        print("[DB] DATABASE_URL not set; DB operations disabled for artist cache")
-        return None
-    try:
-        conn = psycopg2.connect(db_url)
-        conn.autocommit = True
-        return conn
-    except Exception as e:
-        print(f"[DB] Failed to connect to DB for artist cache: {e}")
-        return None
+# ---- Liked-artist registry ----
+class ArtistRegistry:
+    """
+    artist_id -> {"name", "total_liked"} with a normalized-name index kept in step,
+    so validate_track can find an artist by id or by name in O(1).
+    Supports the read-only dict API (get, items, in, [], len) used by callers.
+    """
+
+    def __init__(self, artists=None):
+        self._by_id = {}
+        self._by_name = {}
+        for aid, info in (artists or {}).items():
+            self[aid] = info
+
+    @staticmethod
+    def normalize_name(name):
+        return (name or "").strip().lower()
+
+    def __setitem__(self, aid, info):
+        old = self._by_id.get(aid)
+        if old is not None:
+            old_key = self.normalize_name(old.get("name"))
+            if self._by_name.get(old_key) == aid:
+                del self._by_name[old_key]
+        self._by_id[aid] = info
+        key = self.normalize_name(info.get("name"))
+        if key:
+            # first artist registered under a name wins, like the old linear scan
+            self._by_name.setdefault(key, aid)
+
+    def __getitem__(self, aid):
+        return self._by_id[aid]
+
+    def __contains__(self, aid):
+        return aid in self._by_id
+
+    def __iter__(self):
+        return iter(self._by_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, aid, default=None):
+        return self._by_id.get(aid, default)
+
+    def items(self):
+        return self._by_id.items()
+
+    def keys(self):
+        return self._by_id.keys()
+
+    def get_by_name(self, name):
+        aid = self._by_name.get(self.normalize_name(name))
+        return self._by_id.get(aid) if aid else None
+
+    def find(self, aid=None, name=None):
+        """Look up by id, falling back to the normalized name."""
+        entry = self._by_id.get(aid) if aid else None
+        if entry is None and name:
+            entry = self.get_by_name(name)
+        return entry
+
+    def merge(self, aid, name, total_liked):
+        """Merge a freshly scanned artist: keep the larger total_liked, fill in a missing name."""
+        existing = self._by_id.get(aid)
+        if existing is None:
+            self[aid] = {"name": name or "", "total_liked": total_liked}
+            return
+        try:
+            existing_total = int(existing.get("total_liked", 0) or 0)
+        except Exception:
+            existing_total = 0
+        merged = dict(existing)
+        merged["total_liked"] = max(existing_total, total_liked)
+        if not merged.get("name"):
+            merged["name"] = name or ""
+        self[aid] = merged
 
 def load_artists_from_db():
     """
-    Load artist cache from user_artists table (artist_id -> {name, total_liked})
+    Load artist cache from user_artists table into an ArtistRegistry (artist_id -> {name, total_liked})
     Falls back to reading ARTISTS_FILE if DB is unavailable.
     """
-    conn = get_db_conn()
-    if not conn:
-        # fallback to file if present
+    rows = db_query("SELECT artist_id, artist_name, total_liked FROM user_artists", fetch=True)
+    if rows is None:
+        # DB unavailable or query failed: fallback to file if present
         if os.path.exists(ARTISTS_FILE):
             try:
                 with open(ARTISTS_FILE, "r") as f:
-                    return json.load(f).get("artists", {})
+                    return ArtistRegistry(json.load(f).get("artists", {}))
             except Exception as e:
                 print(f"[WARN] Failed to load {ARTISTS_FILE}: {e}")
-                return {}
-        return {}
+        return ArtistRegistry()
+
+    artists = ArtistRegistry()
+    for r in rows:
+        aid = r.get("artist_id")
+        name = r.get("artist_name") or ""
+        # coerce total_liked to int to avoid later type errors
+        try:
+            total = int(r.get("total_liked") or 0)
+        except Exception:
+            total = 0
+        if aid:
+            artists[aid] = {"name": name, "total_liked": total}
+    return artists
 
+def _parse_added_at(added_at_str):
+    if not added_at_str:
+        return None
     try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute("SELECT artist_id, artist_name, total_liked FROM user_artists")
-            rows = cur.fetchall()
-            artists = {}
-            for r in rows:
-                aid = r.get("artist_id")
-                name = r.get("artist_name") or ""
-                # coerce total_liked to int to avoid later type errors
-                try:
-                    total = int(r.get("total_liked") or 0)
-                except Exception:
-                    total = 0
-                if aid:
-                    artists[aid] = {"name": name, "total_liked": total}
-            return artists
-    except Exception as e:
-        print(f"[DB] Failed to query user_artists: {e}")
-        # fallback to file
-        if os.path.exists(ARTISTS_FILE):
-            try:
-                with open(ARTISTS_FILE, "r") as f:
-                    return json.load(f).get("artists", {})
-            except Exception:
-                pass
-        return {}
+        return datetime.strptime(added_at_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    except Exception:
+        pass
+    # fractional seconds / offsets
+    try:
+        ts = datetime.fromisoformat(added_at_str.replace("Z", "+00:00"))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
 
 def update_artists_from_likes():
+    """
+    Incremental liked-tracks sync. Saved tracks come newest first, so paging stops at the
+    first track at or before the stored added_at watermark. Per-artist like counts from the
+    new tracks are upserted into user_artists in bulk (absolute counts on the first, full
+    sync; increments afterwards) and the new songs are streamed into blacklisted_songs.
+    Returns ({artist_id: {name, total_liked}} counted in this scan, liked songs imported).
+    """
     print("[INFO] Starting to update liked artist cache")
-    
-    # load existing cache only for informational purposes (we won't overwrite DB here)
-    if os.path.exists(ARTISTS_FILE):
-        try:
-            with open(ARTISTS_FILE, "r") as f:
-                artist_cache = json.load(f).get("artists", {})
-        except Exception:
-            artist_cache = {}
+
+    watermark_key = "liked_tracks:newest_added_at"
+    watermark = None
+    if db_enabled():
+        ensure_sync_state_table()
+        watermark = _parse_added_at(get_sync_state(watermark_key))
+    if watermark:
+        print(f"[INFO] Scanning liked tracks added after {watermark.isoformat()}")
     else:
-        artist_cache = {}
+        print("[INFO] No liked-tracks watermark; scanning the full library")
 
-    scan_limit = None if len(artist_cache) < 100 else 100
     offset = 0
     limit = 50
     total_processed = 0
-    new_artists = {}
-    all_liked_songs = []
-
-    print(f"[INFO] Existing artist cache contains {len(artist_cache)} artists")
+    newest_added_at = None
+    scanned_artists = {}
+    # liked songs are streamed into blacklisted_songs (fixed=true) in bulk as pages arrive
+    pending_blacklist = []
+    liked_imported = 0
     batch_number = 1
+    reached_known = False
+    scan_complete = False
 
-    while True:
-        batch_limit = limit
-        if scan_limit:
-            remaining = scan_limit - total_processed
-            if remaining <= 0:
-                print(f"[INFO] Reached scan limit of {scan_limit} tracks")
-                break
-            batch_limit = min(batch_limit, remaining)
-
-        results = safe_spotify_call(sp.current_user_saved_tracks, limit=batch_limit, offset=offset)
+    while not reached_known:
+        results = safe_spotify_call(sp.current_user_saved_tracks, limit=limit, offset=offset)
         if not results or "items" not in results:
             print("[INFO] No more liked tracks returned from Spotify or call failed")
             break
         items = results["items"]
         if not items:
             print("[INFO] No more liked tracks returned from Spotify")
+            scan_complete = True
             break
 
-        new_artists_in_batch = 0
-        existing_artists_in_batch = 0
-
+        artists_in_batch = 0
         for item in items:
             track = item.get("track")
             if not track:
                 continue
-            added_at_str = item.get("added_at")
-            try:
-                added_at = datetime.strptime(added_at_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc) if added_at_str else None
-            except Exception:
-                added_at = None
+            added_at = _parse_added_at(item.get("added_at"))
+            if watermark and added_at and added_at <= watermark:
+                reached_known = True
+                break
+            if added_at and (newest_added_at is None or added_at > newest_added_at):
+                newest_added_at = added_at
 
-            all_liked_songs.append({"track_id": track.get("id"), "artists": track.get("artists", []), "added_at": added_at})
+            pending_blacklist.append({"id": track.get("id"), "name": track.get("name") or "", "artists": track.get("artists") or []})
 
             # process each artist on the track
             for artist in track.get("artists", []):
                 aid = artist.get("id")
                 if not aid:
                     continue
-                if aid not in artist_cache:
-                    artist_cache[aid] = {"name": artist.get("name", ""), "total_liked": 1}
-                    new_artists[aid] = {"name": artist.get("name", ""), "total_liked": 1}
-                    new_artists_in_batch += 1
-                else:
-                    artist_cache[aid]["total_liked"] = artist_cache[aid].get("total_liked", 0) + 1
-                    existing_artists_in_batch += 1
+                entry = scanned_artists.setdefault(aid, {"name": artist.get("name", ""), "total_liked": 0})
+                entry["total_liked"] += 1
+                artists_in_batch += 1
 
             total_processed += 1
 
         print(f"[BATCH {batch_number}] Processed {len(items)} tracks | "
-              f"New artists: {new_artists_in_batch} | "
-              f"Existing artists updated: {existing_artists_in_batch} | "
-              f"Total tracks processed so far: {total_processed}")
-        
+              f"Artist credits counted: {artists_in_batch} | "
+              f"Total new tracks processed so far: {total_processed}")
+
+        if len(pending_blacklist) >= 500:
+            liked_imported += bulk_add_tracks_to_blacklist_db(pending_blacklist, fixed=True)
+            pending_blacklist = []
+
         batch_number += 1
         offset += limit
-
-        if scan_limit and total_processed >= scan_limit:
-            print(f"[INFO] Reached the scan limit of {scan_limit} tracks after batch {batch_number-1}")
+        if len(items) < limit:
+            scan_complete = True
             break
 
-    # Do NOT overwrite ARTISTS_FILE here. Persisting to DB is optional and depends on schema.
-    # Return newly discovered artists (caller will merge with DB-sourced artists).
-    print(f"[INFO] Finished scanning liked tracks: {len(new_artists)} new artists discovered in this run")
-    
-    return new_artists, all_liked_songs
+    if reached_known:
+        print(f"[INFO] Reached previously synced liked tracks after {total_processed} new tracks")
+        scan_complete = True
+
+    if pending_blacklist:
+        liked_imported += bulk_add_tracks_to_blacklist_db(pending_blacklist, fixed=True)
+    if liked_imported:
+        print(f"[DB] Inserted {liked_imported} liked songs into blacklisted_songs with fixed=true")
+
+    if not scan_complete:
+        # counting a partial scan would double-count these tracks when the next run rescans them
+        print("[WARN] Liked-tracks scan did not finish; user_artists and watermark left unchanged")
+    elif scanned_artists and db_enabled():
+        # a full scan yields absolute counts; an incremental one yields increments
+        if upsert_user_artist_counts(scanned_artists, replace=watermark is None):
+            print(f"[DB] Upserted like counts for {len(scanned_artists)} artists into user_artists")
+        else:
+            print("[WARN] Failed to upsert user_artists; liked-tracks watermark not advanced")
+            scan_complete = False
+    if scan_complete and newest_added_at and db_enabled():
+        set_sync_state(watermark_key, newest_added_at.strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+    print(f"[INFO] Finished scanning liked tracks: {len(scanned_artists)} artists counted in this run")
+
+    return scanned_artists, liked_imported
 
 # ==== CALCULATE LOTTERY WEIGHTS ====
 def calculate_weights(all_artists, artist_play_map):
-    now = datetime.now(timezone.utc)
-    recent_14_cutoff = now - timedelta(days=14)
-    recent_60_cutoff = now - timedelta(days=60)
-    stats = {}
-    max_recent_14 = 0
-    max_recent_60 = 0
+    now = cassette.now().timestamp()
+    recent_14_cutoff = now - 14 * 86400
+    recent_60_cutoff = now - 60 * 86400
+    aids = []
+    recent_14_counts = []
+    recent_60_counts = []
+    bonuses = []
 
     for aid, info in all_artists.items():
         artist_name_lower = (info.get("name") or "").lower()
         if not artist_name_lower:
             continue
 
-        scrobbles = artist_play_map.get(artist_name_lower, [])
+        scrobbles = artist_play_map.get(artist_name_lower)
         if not scrobbles:
             continue
 
-        recent_14 = sum(1 for d in scrobbles if d >= recent_14_cutoff)
-        recent_60 = sum(1 for d in scrobbles if d >= recent_60_cutoff)
+        # scrobbles is sorted, so window counts are two binary searches
+        total = len(scrobbles)
         try:
             total_liked = int(info.get("total_liked", 0) or 0)
         except Exception:
             total_liked = 0
 
-        max_recent_14 = max(max_recent_14, recent_14)
-        max_recent_60 = max(max_recent_60, recent_60)
+        aids.append(aid)
+        recent_14_counts.append(total - bisect_left(scrobbles, recent_14_cutoff))
+        recent_60_counts.append(total - bisect_left(scrobbles, recent_60_cutoff))
+        bonuses.append(5 if total_liked > 6 else 0)
 
-        stats[aid] = {"recent_14": recent_14, "recent_60": recent_60, "total_liked": total_liked}
+    if not aids:
+        return {}
 
-    weights = {}
-    for aid, s in stats.items():
-        top_ratio_weight = 0  # placeholder, optional
-        recent_60_weight = (s["recent_60"] / max(1, max_recent_60)) * 60
-        recent_14_weight = (s["recent_14"] / max(1, max_recent_14)) * 10
-        bonus = 5 if s["total_liked"] > 6 else 0
-        weights[aid] = top_ratio_weight + recent_60_weight + recent_14_weight + bonus
+    scale_60 = 60 / max(1, max(recent_60_counts))
+    scale_14 = 10 / max(1, max(recent_14_counts))
+    weights = {
+        aid: r60 * scale_60 + r14 * scale_14 + bonus
+        for aid, r60, r14, bonus in zip(aids, recent_60_counts, recent_14_counts, bonuses)
+    }
 
     return weights
 
-def remove_old_tracks_from_playlist(playlist_id, days_old=8):
+def remove_old_tracks_from_playlist(output_playlist, days_old=8):
     """
-    Scan the entire playlist (paged) and remove any track whose added_at is
-    >= days_old. Uses safe_spotify_call and removes in batches.
-    Note: spotify.playlist_remove_all_occurrences_of_items removes all occurrences
-    of the provided track URIs in the playlist.
+    Remove any track in the output playlist whose added_at is >= days_old,
+    using the already-loaded OutputPlaylist instead of re-paging the playlist
+    (it is read again here if the startup load failed).
     """
-    print(f"[INFO] Scanning entire playlist for tracks older than {days_old} days: {playlist_id}")
-    limit = 100
-    offset = 0
-    now = datetime.now(timezone.utc)
-    uris_to_remove = []
-    while True:
-        res = safe_spotify_call(
-            sp.playlist_items,
-            playlist_id,
-            fields="items(track(id,name,artists(id,name)),added_at)",
-            limit=limit,
-            offset=offset
-        )
-        if not res or "items" not in res or not res["items"]:
-            break
-
-        items = res["items"]
-        for item in items:
-            track = item.get("track")
-            added_at_str = item.get("added_at")
-            if not track or not added_at_str:
-                continue
-            # robust parse: handle "YYYY-MM-DDTHH:MM:SSZ" and fractional seconds
-            ts = None
-            try:
-                s = added_at_str
-                if s.endswith("Z"):
-                    s = s[:-1]
-                # try ISO parse (handles fractional seconds)
-                ts = datetime.fromisoformat(s).replace(tzinfo=timezone.utc)
-            except Exception:
-                try:
-                    ts = datetime.strptime(added_at_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-                except Exception:
-                    # fallback: skip item if we can't parse
-                    print(f"[WARN] Could not parse added_at '{added_at_str}' for track {track.get('id')}, skipping")
-                    continue
-
-            age_days = (now - ts).days
-            if age_days >= days_old:
-                tid = track.get("id")
-                if tid:
-                    uri = f"spotify:track:{tid}"
-                    uris_to_remove.append(uri)
-
-        # paging advance
-        if len(items) < limit:
-            break
-        offset += limit
-
-    if not uris_to_remove:
-        print(f"[INFO] No tracks older than {days_old} days found in playlist {playlist_id}")
+    print(f"[INFO] Checking playlist for tracks older than {days_old} days: {output_playlist.playlist_id}")
+    if not output_playlist.loaded:
+        # the startup load failed; expiry needs the playlist's real added_at dates, so read it again
+        print("[INFO] Output playlist was not loaded at startup; retrying before expiry")
+        if not output_playlist.load():
+            print(f"[WARN] Could not fetch playlist {output_playlist.playlist_id}; skipping old-track removal")
+            return 0
+    old_ids = output_playlist.ids_older_than(days_old)
+    if not old_ids:
+        print(f"[INFO] No tracks older than {days_old} days found in playlist {output_playlist.playlist_id}")
         return 0
 
-    # remove in batches to avoid API limits
-    removed_total = 0
-    batch_size = 50
-    for i in range(0, len(uris_to_remove), batch_size):
-        batch = uris_to_remove[i:i+batch_size]
-        res = safe_spotify_call(sp.playlist_remove_all_occurrences_of_items, playlist_id, batch)
-        if res is None:
-            print(f"[WARN] Removal batch failed for {len(batch)} URIs")
-        else:
-            removed_total += len(batch)
-            print(f"[INFO] Removed batch of {len(batch)} URIs from playlist {playlist_id}")
-
-    print(f"[INFO] Removed {removed_total} track URIs older than {days_old} days from playlist {playlist_id}")
-    return removed_total
+    removed = output_playlist.remove(old_ids, label="old URIs")
+    print(f"[INFO] Removed {len(removed)} track URIs older than {days_old} days from playlist {output_playlist.playlist_id}")
+    return len(removed)
 
 # add track_allowed_to_add helper to check DB blacklists before adding a track
 def track_allowed_to_add(track):
@@ -873,7 +1816,7 @@ def track_allowed_to_add(track):
 
     return True, ""
 def send_playlist_update_sms(songs_added, max_songs, removed_count, playlist_id, whitelist_added=0, whitelist_target=10):
-    today = datetime.now(timezone.utc).strftime("%m/%d/%Y")
+    today = cassette.now().strftime("%m/%d/%Y")
     playlist_link = f"https://open.spotify.com/playlist/{playlist_id}"
     
     # Determine status
@@ -896,6 +1839,10 @@ def send_playlist_update_sms(songs_added, max_songs, removed_count, playlist_id,
         f"Playlist Link: {playlist_link}"
     )
 
+    if cassette.replaying:
+        print(f"[CASSETTE] SMS not sent during replay:\n{message_body}")
+        return
+
     data = {"to": MY_PHONE, "message": message_body}
     headers = {
         "Content-Type": "application/json",
@@ -911,172 +1858,277 @@ def send_playlist_update_sms(songs_added, max_songs, removed_count, playlist_id,
     except Exception as e:
         print(f"⚠️ Exception occurred while sending SMS: {e}")
 
-# ==== PAGED PLAYLIST HELPERS (improves duplicate detection) ====
-def fetch_all_playlist_items(playlist_id, page_limit=100):
-    """Return list of track objects (paged) for a playlist_id using safe_spotify_call."""
-    offset = 0
-    all_items = []
-    while True:
-        res = safe_spotify_call(
-            sp.playlist_items,
-            playlist_id,
-            fields="items(track(id,name,artists(id,name)), added_at)",
-            limit=page_limit,
-            offset=offset
-        )
-        if not res or "items" not in res or not res["items"]:
-            break
-        # keep the raw items so callers can inspect added_at etc.
-        all_items.extend([it.get("track") for it in res["items"] if it.get("track")])
-        if len(res["items"]) < page_limit:
-            break
-        offset += page_limit
-    return all_items
+# ==== OUTPUT PLAYLIST MODEL ====
+class OutputPlaylist:
+    """
+    In-memory view of the output playlist, loaded once (with added_at) and kept
+    current as this run adds/removes tracks. Provides the dedupe set
+    (artist_ids/first_artist_map) and the expiry/removal sets.
+    """
 
-# ...existing code...
+    def __init__(self, playlist_id):
+        self.playlist_id = playlist_id
+        self.items = []
+        self.loaded = False
+        self.artist_ids = set()
+        self.first_artist_map = {}
+
+    def load(self):
+        """(Re)read the playlist from Spotify. On failure the current view is kept and False returned."""
+        items = get_playlist_contents(self.playlist_id, reuse_in_run=False)
+        if items is None:
+            return self.loaded
+        self.loaded = True
+        self.items = [it for it in items if it.get("track")]
+        self._reindex()
+        return True
+
+    def _reindex(self):
+        tracks = self.tracks()
+        # update in place: LotterySelection and validate_track hold references to these
+        self.artist_ids.clear()
+        self.artist_ids.update(build_existing_artist_ids(tracks))
+        self.first_artist_map.clear()
+        self.first_artist_map.update(build_artist_first_map(tracks))
+
+    def tracks(self):
+        return [it["track"] for it in self.items]
+
+    def track_ids(self):
+        return {it["track"].get("id") for it in self.items if it["track"].get("id")}
+
+    def record_add(self, track):
+        """Reflect a track this run added to the playlist."""
+        self.items.append({"added_at": cassette.now().strftime("%Y-%m-%dT%H:%M:%SZ"), "track": track})
+        artists = track.get("artists") or []
+        if artists and artists[0].get("id"):
+            self.artist_ids.add(artists[0]["id"])
+        artist_key = _artist_key_from_track(track)
+        if artist_key and artist_key not in self.first_artist_map:
+            self.first_artist_map[artist_key] = {"track_id": track.get("id"), "track_name": track.get("name") or "<unknown>", "pos": len(self.items) - 1}
+
+    def discard(self, track_ids):
+        """Forget tracks that were recorded but never made it into the playlist."""
+        track_ids = set(track_ids)
+        self.items = [it for it in self.items if it["track"].get("id") not in track_ids]
+        self._reindex()
+
+    def ids_older_than(self, days_old):
+        now = cassette.now()
+        ids = set()
+        for it in self.items:
+            tid = it["track"].get("id")
+            added_at_str = it.get("added_at")
+            if not tid or not added_at_str:
+                continue
+            ts = _parse_added_at(added_at_str)
+            if ts is None:
+                print(f"[WARN] Could not parse added_at '{added_at_str}' for track {tid}, skipping")
+                continue
+            if (now - ts).days >= days_old:
+                ids.add(tid)
+        return ids
+
+    def remove(self, track_ids, label="tracks"):
+        """
+        Remove the given track ids from the playlist, skipping ids that are not present.
+        Returns the set of ids actually removed.
+        Note: playlist_remove_all_occurrences_of_items removes every occurrence of a URI.
+        """
+        present = sorted(set(track_ids) & self.track_ids()) if self.loaded else sorted(set(track_ids))
+        removed = set()
+        batch_size = 50
+        for i in range(0, len(present), batch_size):
+            batch = present[i:i + batch_size]
+            uris = [f"spotify:track:{tid}" for tid in batch]
+            res = safe_spotify_call(sp.playlist_remove_all_occurrences_of_items, self.playlist_id, uris)
+            if res is None:
+                print(f"[WARN] Removal batch failed for {len(batch)} {label}")
+            else:
+                removed.update(batch)
+                print(f"[INFO] Removed batch of {len(batch)} {label} from playlist {self.playlist_id}")
+        if removed:
+            self.items = [it for it in self.items if it["track"].get("id") not in removed]
+        return removed
 
-def add_track_to_blacklist_db(track, fixed=False):
+class PlaylistWriter:
     """
-    Insert a track into blacklisted_songs with fixed flag.
-    Attempts insertion with created_at column if present, otherwise falls back.
+    Write-behind buffer for the output playlist. Accepted tracks are recorded in the
+    OutputPlaylist model right away (so dedupe sees them) and written in batches of up
+    to batch_size URIs; failed batches are retried, and only tracks whose batch
+    succeeded are inserted into blacklisted_songs. Tracks from a batch that still
+    fails are dropped from the model again.
     """
-    if not track or not isinstance(track, dict):
-        return
-    tid = track.get("id")
-    if not tid:
-        return
-    song_name = track.get("name") or ""
-    artists = track.get("artists") or []
-    artist_id = artists[0].get("id") if artists and artists[0].get("id") else None
-    artist_name = artists[0].get("name") if artists and artists[0].get("name") else None
-
-    conn = get_db_conn()
-    if not conn:
-        print("[DB] No DB connection available to insert blacklisted song")
-        return
-    try:
-        with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    """
-                    INSERT INTO blacklisted_songs (song_id, song_name, artist_id, artist_name, fixed, created_at)
-                    VALUES (%s, %s, %s, %s, %s, NOW())
-                    ON CONFLICT (song_id) DO NOTHING
-                    """,
-                    (tid, song_name, artist_id, artist_name, fixed),
-                )
-            except Exception:
-                # fallback if created_at doesn't exist
-                try:
-                    cur.execute(
-                        """
-                        INSERT INTO blacklisted_songs (song_id, song_name, artist_id, artist_name, fixed)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (song_id) DO NOTHING
-                        """,
-                        (tid, song_name, artist_id, artist_name, fixed),
-                    )
-                except Exception as e2:
-                    print(f"[DB] Failed to insert blacklisted song (fallback): {e2}")
-    except Exception as e:
-        print(f"[DB] Failed to insert blacklisted song: {e}")
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
-def cleanup_old_blacklisted_songs(playlist_id, days=14):
+    def __init__(self, output_playlist, batch_size=100, retries=3):
+        self.output_playlist = output_playlist
+        self.batch_size = batch_size
+        self.retries = retries
+        self.pending = []
+        self.written = Counter()
+        self.failed = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, track, source="lottery"):
+        with self._lock:
+            self.output_playlist.record_add(track)
+            self.pending.append((track, source))
+            if len(self.pending) < self.batch_size:
+                return
+        self.flush()
+
+    def flush(self):
+        """Write all pending tracks. Returns the list of (track, source) that could not be written."""
+        with self._lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        with telemetry.stage("playlist_write"):
+            return self._flush(pending)
+
+    def _flush(self, pending):
+        failed = []
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            if self._write_batch([t["id"] for t, _ in batch]):
+                added = bulk_add_tracks_to_blacklist_db([t for t, _ in batch], fixed=False)
+                print(f"[DB] Inserted {added} added tracks into blacklisted_songs (fixed=false)")
+                self.written.update(src for _, src in batch)
+            else:
+                failed.extend(batch)
+        if failed:
+            print(f"[WARN] {len(failed)} tracks could not be added to playlist {self.output_playlist.playlist_id}")
+            self.output_playlist.discard(t["id"] for t, _ in failed)
+            self.failed.update(src for _, src in failed)
+        return failed
+
+    def _write_batch(self, track_ids):
+        for attempt in range(self.retries):
+            res = safe_spotify_call(sp.playlist_add_items, self.output_playlist.playlist_id, track_ids)
+            if res is not None:
+                print(f"[INFO] Added batch of {len(track_ids)} tracks to playlist {self.output_playlist.playlist_id}")
+                return True
+            print(f"[WARN] Playlist add batch of {len(track_ids)} failed (attempt {attempt + 1}/{self.retries})")
+            if attempt + 1 < self.retries:
+                time.sleep(backoff_delay(attempt, base=2.0))
+        return False
+
+def bulk_add_tracks_to_blacklist_db(tracks, fixed=False, page_size=500):
+    """
+    Insert many tracks into blacklisted_songs in one connection using execute_values
+    (ON CONFLICT DO NOTHING). Falls back to omitting created_at if that column is missing.
+    Returns the number of rows sent.
+    """
+    rows = []
+    seen = set()
+    for track in tracks:
+        if not track or not isinstance(track, dict):
+            continue
+        tid = track.get("id")
+        if not tid or tid in seen:
+            continue
+        seen.add(tid)
+        artists = track.get("artists") or []
+        artist_id = artists[0].get("id") if artists and artists[0].get("id") else None
+        artist_name = artists[0].get("name") if artists and artists[0].get("name") else None
+        rows.append((tid, track.get("name") or "", artist_id, artist_name, fixed))
+        remember_blacklisted_song(tid, artist_id)
+    if not rows:
+        return 0
+
+    ok = db_execute_values(
+        """
+        INSERT INTO blacklisted_songs (song_id, song_name, artist_id, artist_name, fixed, created_at)
+        VALUES %s
+        ON CONFLICT (song_id) DO NOTHING
+        """,
+        rows,
+        template="(%s, %s, %s, %s, %s, NOW())",
+        page_size=page_size,
+    )
+    if not ok:
+        # fallback if created_at doesn't exist
+        ok = db_execute_values(
+            """
+            INSERT INTO blacklisted_songs (song_id, song_name, artist_id, artist_name, fixed)
+            VALUES %s
+            ON CONFLICT (song_id) DO NOTHING
+            """,
+            rows,
+            page_size=page_size,
+        )
+    return len(rows) if ok else 0
+
+def cleanup_old_blacklisted_songs(output_playlist, days=14):
     """
     Remove tracks from the playlist that are in blacklisted_songs with fixed = false
-    and older than `days`. After removal, mark them fixed = true.
+    and older than `days`. Only ids actually present in the output playlist are sent;
+    removed and already-absent ids are then marked fixed = true.
     Returns number of tracks removed.
     """
-    conn = get_db_conn()
-    if not conn:
+    if not db_enabled():
         print("[DB] No DB connection available for cleanup_old_blacklisted_songs")
         return 0
-    try:
-        with conn.cursor() as cur:
-            # try to select using created_at if available
-            try:
-                cur.execute(
-                    """
-                    SELECT song_id FROM blacklisted_songs
-                    WHERE fixed = false AND created_at <= (NOW() - INTERVAL %s)
-                    """,
-                    (f"{days} days",),
-                )
-            except Exception as e:
-                # created_at might not exist, fallback: select all fixed=false (can't filter by age)
-                print(f"[DB] cleanup query with created_at failed: {e}; attempting fallback select of all fixed=false")
-                try:
-                    cur.execute(
-                        "SELECT song_id, created_at FROM blacklisted_songs WHERE fixed = false"
-                    )
-                    rows = cur.fetchall()
-                    # if created_at not available, don't remove anything conservatively
-                    # try to filter by created_at if present in row
-                    song_ids = []
-                    now = datetime.now(timezone.utc)
-                    for r in rows:
-                        sid = r[0]
-                        created = None
-                        if len(r) > 1 and isinstance(r[1], datetime):
-                            created = r[1]
-                        if created:
-                            age_days = (now - created).days
-                            if age_days >= days:
-                                song_ids.append(sid)
-                    if not song_ids:
-                        print("[DB] No qualifying old blacklisted songs found in fallback")
-                        return 0
-                except Exception as e2:
-                    print(f"[DB] Fallback cleanup query failed: {e2}")
-                    return 0
-            else:
-                rows = cur.fetchall()
-                song_ids = [r[0] for r in rows if r and r[0]]
-            if not song_ids:
-                print("[DB] No old blacklisted songs to remove")
-                return 0
-
-            # build URIs and remove in batches
-            uris = [f"spotify:track:{sid}" for sid in sorted(set(song_ids))]
-            removed_total = 0
-            batch_size = 50
-            for i in range(0, len(uris), batch_size):
-                batch = uris[i : i + batch_size]
-                res = safe_spotify_call(sp.playlist_remove_all_occurrences_of_items, playlist_id, batch)
-                if res is None:
-                    print(f"[WARN] Removal batch failed for {len(batch)} URIs during blacklist cleanup")
-                else:
-                    removed_total += len(batch)
-                    print(f"[INFO] Removed {len(batch)} blacklisted URIs from playlist {playlist_id}")
+    rows = db_query(
+        """
+        SELECT song_id FROM blacklisted_songs
+        WHERE fixed = false AND created_at <= (NOW() - INTERVAL %s)
+        """,
+        (f"{days} days",),
+        fetch=True,
+    )
+    if rows is not None:
+        song_ids = [r[0] for r in rows if r and r[0]]
+    else:
+        # created_at might not exist (or DB unavailable), fallback: select all fixed=false
+        print("[DB] cleanup query with created_at failed; attempting fallback select of all fixed=false")
+        rows = db_query("SELECT song_id, created_at FROM blacklisted_songs WHERE fixed = false", fetch=True)
+        if rows is None:
+            print("[DB] Fallback cleanup query failed")
+            return 0
+        # if created_at not available, don't remove anything conservatively
+        # try to filter by created_at if present in row
+        song_ids = []
+        now = cassette.now()
+        for r in rows:
+            sid = r[0]
+            created = None
+            if len(r) > 1 and isinstance(r[1], datetime):
+                created = r[1]
+            if created:
+                age_days = (now - created).days
+                if age_days >= days:
+                    song_ids.append(sid)
+        if not song_ids:
+            print("[DB] No qualifying old blacklisted songs found in fallback")
+            return 0
+    if not song_ids:
+        print("[DB] No old blacklisted songs to remove")
+        return 0
 
-            if removed_total > 0:
-                # mark removed song_ids as fixed = true
-                try:
-                    cur.execute(
-                        """
-                        UPDATE blacklisted_songs SET fixed = true
-                        WHERE song_id = ANY(%s)
-                        """,
-                        (list(set(song_ids)),),
-                    )
-                    print(f"[DB] Marked {len(set(song_ids))} blacklisted_songs.fixed = true")
-                except Exception as e:
-                    print(f"[DB] Failed to mark blacklisted_songs fixed: {e}")
+    song_ids = set(song_ids)
+    removed = output_playlist.remove(song_ids, label="blacklisted URIs")
+    # ids that were not in the playlist need no removal; only trust that when the playlist loaded
+    fixed_ids = removed | (song_ids - output_playlist.track_ids() if output_playlist.loaded else set())
+    if fixed_ids:
+        db_query(
+            """
+            UPDATE blacklisted_songs SET fixed = true
+            WHERE song_id = ANY(%s)
+            """,
+            (list(fixed_ids),),
+        )
+        print(f"[DB] Marked {len(fixed_ids)} blacklisted_songs.fixed = true ({len(removed)} removed from playlist)")
 
-            return removed_total
+    return len(removed)
+
+def save_rolled_tracks(rolled_tracks, path=OUTPUT_FILE):
+    """Write this run's lottery report (artist, drawn weight, song added)."""
+    try:
+        with open(path, "w") as f:
+            json.dump(rolled_tracks, f, indent=2)
     except Exception as e:
-        print(f"[DB] Error during cleanup_old_blacklisted_songs: {e}")
-        return 0
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        print(f"[WARN] Failed to write {path}: {e}")
 
 def build_existing_artist_ids(tracks):
     ids = set()
@@ -1116,35 +2168,246 @@ def _artist_key_from_track(t):
         return f"name:{name}"
     return None
 
+# ==== LOTTERY SELECTION ====
+class LotterySampler:
+    """
+    Weighted lottery without replacement (Efraimidis-Spirakis). Every artist gets the
+    key log(u) / weight once up front; drawing walks the keys in descending order, which
+    yields the same distribution as repeated weighted draws that skip already-rolled
+    artists, at O(1) per draw. Artists with weight <= 0 are never drawn.
+    """
+
+    def __init__(self, weights, rng=None):
+        rng = rng or random
+        keyed = [
+            (math.log(1.0 - rng.random()) / w, aid)
+            for aid, w in weights.items()
+            if w and w > 0
+        ]
+        keyed.sort(reverse=True)
+        self._order = [aid for _, aid in keyed]
+        self._weights = weights
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._order) - self._pos
+
+    def draw(self):
+        """Return (artist_id, weight) for the next pick, or None when every artist has been drawn."""
+        if self._pos >= len(self._order):
+            return None
+        aid = self._order[self._pos]
+        self._pos += 1
+        return aid, self._weights[aid]
+
+class LotterySelection:
+    """
+    Runs the artist lottery until max_songs tracks are added.
+    With workers > 1 several lottery picks run select_track_for_artist at once;
+    the final gate + playlist add is serialized so two workers never add the
+    same artist and the run stops at exactly max_songs.
+    """
+
+    def __init__(self, weights, all_artists, artists_data, writer, max_songs=50, workers=1):
+        self.weights = weights
+        self.all_artists = all_artists
+        self.artists_data = artists_data
+        self.writer = writer
+        output_playlist = writer.output_playlist
+        self.existing_artist_ids = output_playlist.artist_ids
+        self.first_artist_map = output_playlist.first_artist_map
+        self.max_songs = max_songs
+        self.workers = max(1, int(workers or 1))
+        self.songs_added = 0
+        self.rolled_aids = set()
+        self.sampler = LotterySampler(weights)
+        # track_id -> rolled entry for each added track, written to OUTPUT_FILE at the end of the run
+        self._rolled = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rolled_tracks(self):
+        return list(self._rolled.values())
+
+    def quota_reached(self):
+        return self.songs_added >= self.max_songs
+
+    def draw(self):
+        """Pick the next not-yet-rolled artist via lottery. Returns (artist_id, weight) or None when exhausted."""
+        pick = self.sampler.draw()
+        if pick is not None:
+            self.rolled_aids.add(pick[0])
+        return pick
+
+    def run(self):
+        """
+        Select until max_songs tracks are accepted, then flush the playlist writer.
+        If some batches could not be written, the shortfall is refilled from the
+        remaining lottery draws.
+        """
+        while True:
+            self._select()
+            failed = self.writer.flush()
+            if not failed:
+                break
+            with self._lock:
+                self.songs_added -= len(failed)
+                for t, _ in failed:
+                    self._rolled.pop(t.get("id"), None)
+            if not len(self.sampler):
+                break
+            print(f"[INFO] Refilling {len(failed)} tracks that failed to write")
+        return self.songs_added
+
+    def _select(self):
+        if self.workers == 1:
+            while not self.quota_reached():
+                pick = self.draw()
+                if pick is None:
+                    break
+                self.process_pick(*pick)
+            return self.songs_added
+
+        print(f"[INFO] Running lottery selection with {self.workers} concurrent workers")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = set()
+            while True:
+                # lottery draws stay on this thread so rolled_aids is never raced
+                while len(in_flight) < self.workers and not self.quota_reached():
+                    pick = self.draw()
+                    if pick is None:
+                        break
+                    in_flight.add(pool.submit(self.process_pick, *pick))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    fut.result()
+        return self.songs_added
+
+    def process_pick(self, chosen_aid, weight):
+        artist_name = self.all_artists[chosen_aid]["name"]
+        print(f"[INFO] Lottery picked artist '{artist_name}' (weight {weight:.2f})")
+
+        track = select_track_for_artist(artist_name, self.artists_data, self.existing_artist_ids, artist_id=chosen_aid)
+
+        if track is None:
+            print(f"[INFO] No valid track found for '{artist_name}', rerolling lottery")
+            return False
+        with self._lock:
+            added = self.commit_track(track)
+            if added:
+                self._rolled[track.get("id")] = {
+                    "rolled_artist": artist_name,
+                    "lottery_weight": weight,
+                    "song_added": track.get("name") or "<unknown>",
+                }
+            return added
+
+    def commit_track(self, track):
+        """Final gate + playlist add. Callers must hold self._lock."""
+        if self.quota_reached():
+            print(f"[INFO] Quota of {self.max_songs} reached; discarding '{track.get('name')}'")
+            return False
+
+        # Final gate: enforce DB and playlist validation AGAIN with full existing_artist_ids
+        track_id = track.get("id")
+        if not track_id:
+            print(f"[WARN] Skipping invalid track with missing ID: {track}")
+            return False
+
+        allowed_db, reason_db = track_allowed_to_add(track)
+        valid_logic, reason_logic = validate_track(track, self.artists_data, self.existing_artist_ids, max_followers=None)
+
+        # If validate fails due to existing artist in playlist, try to include reporting of first occurrence
+        if not valid_logic and "already has a track" in (reason_logic or "").lower():
+            artist_key = _artist_key_from_track(track)
+            first = self.first_artist_map.get(artist_key) if artist_key else None
+            if first:
+                reason_logic = f"{reason_logic}; first occurrence: '{first['track_name']}' (pos {first['pos']})"
+
+        if not allowed_db:
+            print(f"[INFO] Skipping track '{track.get('name')}' - DB block: {reason_db}")
+            return False
+        if not valid_logic:
+            print(f"[INFO] Skipping track '{track.get('name')}' - validation block: {reason_logic}")
+            return False
+
+        # Passed final gates: queue the add; the writer records it in the playlist model
+        # (so further validations in this run see it) and blacklists it once written
+        self.writer.add(track, source="lottery")
+        self.songs_added += 1
+        print(f"[INFO] Added track '{track.get('name','<unknown>')}' by '{track.get('artists',[{}])[0].get('name','<unknown>')}' | Total songs accepted: {self.songs_added}/{self.max_songs}")
+        return True
+
+
+# ==== OFFLINE ARTIST-PLAYLIST REFRESH ====
+def refresh_artist_playlists(top_n=100):
+    """
+    Pre-warm the artist-playlist store: scrape the top_n highest-weight artists whose
+    stored playlists are missing or stale. Meant to run outside the daily job, e.g.
+    `python script.py --refresh-artist-playlists 200`. Weights come from the stored
+    scrobbles (read_recent_tracks), so the daily job's scrobble watermark is left alone.
+    """
+    ensure_artist_playlists_table()
+    ensure_playlist_snapshots_table()
+    all_artists = load_artists_from_db()
+    weights = calculate_weights(all_artists, build_artist_play_map(read_recent_tracks()))
+    ranked = sorted(weights, key=weights.get, reverse=True)[:top_n]
+    print(f"[REFRESH] Checking stored playlists for the top {len(ranked)} artists by lottery weight")
+    stale = [aid for aid in ranked if get_cached_artist_playlists(aid, ARTIST_PLAYLISTS_TTL) is None]
+    print(f"[REFRESH] Scraping {len(stale)} artists with {SCRAPER_POOL_SIZE} drivers")
+    refreshed = 0
+    try:
+        for aid, playlists in scrape_many_artist_playlists(stale).items():
+            if playlists:
+                store_artist_playlists(aid, playlists)
+                refreshed += 1
+            print(f"[REFRESH] {all_artists[aid].get('name')} ({aid}): {len(playlists)} playlists")
+    finally:
+        close_driver_pool()
+    print(f"[REFRESH] Stored fresh playlists for {refreshed} artists")
+    return refreshed
+
 # ==== MAIN COMBINED SCRIPT ====
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--refresh-artist-playlists":
+        usage = "usage: python script.py --refresh-artist-playlists [TOP_N]  (TOP_N: positive integer, default 100)"
+        try:
+            top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+        except ValueError:
+            top_n = 0
+        if top_n < 1 or len(sys.argv) > 3:
+            print(usage, file=sys.stderr)
+            sys.exit(2)
+        refresh_artist_playlists(top_n)
+        close_db_pool()
+        sys.exit(0)
+
     print("Starting Enhanced Recs Script...")
-    time.sleep(1)
+    if cassette.active:
+        random.seed(cassette.seed)
+        print(f"[CASSETTE] {cassette.mode} mode ({cassette.path}), seed {cassette.seed}")
+    else:
+        time.sleep(1)
 
-    new_artists, liked_songs = update_artists_from_likes()
+    ensure_spotify_cache_table()
+    ensure_artist_playlists_table()
+    ensure_playlist_snapshots_table()
+    ensure_similar_artists_tables()
 
-    # Persist detected liked songs into blacklisted_songs with fixed = true so they are excluded
-    try:
-        inserted = 0
-        for ls in liked_songs:
-            tid = ls.get("track_id")
-            if not tid:
-                continue
-            # build minimal track dict to reuse insertion helper
-            track_stub = {"id": tid, "name": ls.get("track") or "", "artists": ls.get("artists") or []}
-            add_track_to_blacklist_db(track_stub, fixed=True)
-            inserted += 1
-        if inserted:
-            print(f"[DB] Inserted {inserted} liked songs into blacklisted_songs with fixed=true")
-    except Exception as e:
-        print(f"[WARN] Failed to insert liked songs into blacklist DB: {e}")
+    # liked songs are bulk-inserted into blacklisted_songs (fixed = true) while scanning
+    with telemetry.stage("likes_sync"):
+        new_artists, liked_imported = update_artists_from_likes()
+
+    # Bulk-load blacklists once so per-candidate checks are in-memory lookups
+    with telemetry.stage("blacklist_index"):
+        load_blacklist_index()
 
     # Load canonical artist cache from DB (fallback to file if DB absent)
-    artists_data = load_artists_from_db()
+    all_artists = load_artists_from_db()
 
     # Merge DB-cache with newly discovered artists (new_artists may include names/total_liked increments)
-    all_artists = {**artists_data}
-
     def _to_int(v):
         try:
             return int(v)
@@ -1152,107 +2415,49 @@ if __name__ == "__main__":
             return 0
 
     for aid, info in new_artists.items():
-        new_total = _to_int(info.get("total_liked", 0))
-        new_name = info.get("name") or ""
-        if aid in all_artists:
-            existing_total = _to_int(all_artists[aid].get("total_liked", 0))
-            all_artists[aid]["total_liked"] = max(existing_total, new_total)
-            if not all_artists[aid].get("name"):
-                all_artists[aid]["name"] = new_name
-        else:
-            all_artists[aid] = {"name": new_name, "total_liked": new_total}
+        all_artists.merge(aid, info.get("name") or "", _to_int(info.get("total_liked", 0)))
 
     # Ensure validation uses the merged view (DB + newly scanned liked songs)
-    artists_data = dict(all_artists)
-
-    recent_tracks = fetch_all_recent_tracks()
-    artist_play_map = build_artist_play_map(recent_tracks)
+    artists_data = all_artists
 
-    weights = calculate_weights(all_artists, artist_play_map)
+    with telemetry.stage("scrobbles"):
+        recent_tracks = sync_recent_tracks()
+    with telemetry.stage("weights"):
+        artist_play_map = build_artist_play_map(recent_tracks)
+        weights = calculate_weights(all_artists, artist_play_map)
 
     songs_added = 0
     max_songs = 50
-    rolled_aids = set()
 
-    # --- REPLACE single-page fetch with a full paged fetch to build accurate existing_artist_ids & first-occurrence map
-    existing_tracks = fetch_all_playlist_items(OUTPUT_PLAYLIST_ID, page_limit=100)
-    if not existing_tracks:
-        existing_artist_ids = set()
+    # load the output playlist once; it provides the dedupe set now and the expiry set at cleanup
+    output_playlist = OutputPlaylist(OUTPUT_PLAYLIST_ID)
+    with telemetry.stage("output_playlist_load"):
+        loaded = output_playlist.load()
+    if not loaded:
         print(f"[WARN] Could not fetch existing playlist items for {OUTPUT_PLAYLIST_ID}, proceeding with empty set")
-    else:
-        existing_artist_ids = build_existing_artist_ids(existing_tracks)
-    first_artist_map = build_artist_first_map(existing_tracks)
-    print(f"[INFO] Found {len(existing_artist_ids)} existing artists in playlist (paged)")
-
+    existing_artist_ids = output_playlist.artist_ids
+    print(f"[INFO] Found {len(existing_artist_ids)} existing artists in playlist")
+
+    playlist_writer = PlaylistWriter(output_playlist)
+    selection = LotterySelection(
+        weights,
+        all_artists,
+        artists_data,
+        playlist_writer,
+        max_songs=max_songs,
+        workers=SELECTION_WORKERS,
+    )
     try:
-        while songs_added < max_songs and len(rolled_aids) < len(weights):
-            # Pick artist via lottery
-            artist_ids = list(weights.keys())
-            weight_values = [weights[aid] for aid in artist_ids]
-            chosen_aid = choices(artist_ids, weights=weight_values, k=1)[0]
-            if chosen_aid in rolled_aids:
-                continue
-            rolled_aids.add(chosen_aid)
-            artist_name = all_artists[chosen_aid]["name"]
-            print(f"[INFO] Lottery picked artist '{artist_name}' (weight {weights[chosen_aid]:.2f})")
-
-            track = select_track_for_artist(artist_name, artists_data, existing_artist_ids)
-
-            if track is None:
-                print(f"[INFO] No valid track found for '{artist_name}', rerolling lottery")
-                continue
-
-            # Final gate: enforce DB and playlist validation AGAIN with full existing_artist_ids
-            track_id = track.get("id")
-            if not track_id:
-                print(f"[WARN] Skipping invalid track with missing ID: {track}")
-                continue
-
-            allowed_db, reason_db = track_allowed_to_add(track)
-            valid_logic, reason_logic = validate_track(track, artists_data, existing_artist_ids, max_followers=None)
-
-            # If validate fails due to existing artist in playlist, try to include reporting of first occurrence
-            if not valid_logic and "already has a track" in (reason_logic or "").lower():
-                artist_key = _artist_key_from_track(track)
-                first = first_artist_map.get(artist_key) if artist_key else None
-                if first:
-                    reason_logic = f"{reason_logic}; first occurrence: '{first['track_name']}' (pos {first['pos']})"
-
-            if not allowed_db:
-                print(f"[INFO] Skipping track '{track.get('name')}' - DB block: {reason_db}")
-                continue
-            if not valid_logic:
-                print(f"[INFO] Skipping track '{track.get('name')}' - validation block: {reason_logic}")
-                continue
-
-            # Passed final gates: add track
-            add_res = safe_spotify_call(sp.playlist_add_items, OUTPUT_PLAYLIST_ID, [track_id])
-            if add_res is None:
-                print(f"[WARN] Failed to add track '{track.get('name')}' (API error).")
-                continue
-
-            # insert into blacklisted_songs (fixed = false) so this track is ineligible on future runs
-            try:
-                add_track_to_blacklist_db(track)
-                print(f"[DB] Inserted added track '{track.get('name')}' ({track_id}) into blacklisted_songs (fixed=false)")
-            except Exception as e:
-                print(f"[DB] Failed to insert added track into blacklisted_songs: {e}")
-
-            # update local caches so further validations are accurate within this run
-            first_artist_id = None
-            if isinstance(track.get("artists"), list) and track["artists"]:
-                first_artist_id = track["artists"][0].get("id")
-            if first_artist_id:
-                existing_artist_ids.add(first_artist_id)
-                # also add to first_artist_map if absent
-                artist_key = _artist_key_from_track(track)
-                if artist_key and artist_key not in first_artist_map:
-                    first_artist_map[artist_key] = {"track_id": track_id, "track_name": track.get("name") or "<unknown>", "pos": None}
-            songs_added += 1
-            print(f"[INFO] Added track '{track.get('name','<unknown>')}' by '{track.get('artists',[{}])[0].get('name','<unknown>')}' | Total songs added: {songs_added}/{max_songs}")
+        with telemetry.stage("selection"):
+            selection.run()
     finally:
+        # write anything still buffered if selection stopped early; count only tracks actually written
+        playlist_writer.flush()
+        songs_added = playlist_writer.written["lottery"]
+        save_rolled_tracks(selection.rolled_tracks)
         # After main rolling, attempt to add up to 10 tracks sourced from whitelisted user profiles (if we hit quota)
         whitelist_added = 0
+        whitelist_start = time.monotonic()
         try:
             if songs_added >= max_songs:
                 print("[INFO] Attempting to add up to 10 tracks from whitelisted user profiles")
@@ -1284,8 +2489,8 @@ if __name__ == "__main__":
                         print(f"[WHITELIST] Playlist {pid} is blacklisted in DB; skipping.")
                         continue
 
-                    items = safe_spotify_call(sp.playlist_items, pid, fields="items(track(id,name,artists(id,name)))", limit=100)
-                    if not items or "items" not in items or not items["items"]:
+                    items = get_playlist_contents(pid, first_page_only=True, snapshot_id=candidate_pl.get("snapshot_id"))
+                    if not items:
                         print(f"[WHITELIST] Could not fetch items for playlist '{pl_name}' ({pid}). Marking blacklisted.")
                         try:
                             mark_playlist_blacklisted(pid)
@@ -1295,7 +2500,7 @@ if __name__ == "__main__":
 
                     # build candidate track list with safe fields
                     tracks = []
-                    for it in items["items"]:
+                    for it in items:
                         tr = it.get("track")
                         if not tr or not tr.get("id"):
                             continue
@@ -1323,44 +2528,45 @@ if __name__ == "__main__":
                         print(f"[WHITELIST] Skipping '{track_name}' - validate logic: {reason_logic}")
                         continue
 
-                    # Add the whitelist track
-                    add_res = safe_spotify_call(sp.playlist_add_items, OUTPUT_PLAYLIST_ID, [picked.get("id")])
-                    if add_res is None:
-                        print(f"[WHITELIST] Failed to add '{track_name}' to playlist (API error).")
-                        # don't increment whitelist_added; continue attempting
-                        continue
-
-                    # insert whitelist-added track into blacklisted_songs (fixed = false)
-                    try:
-                        add_track_to_blacklist_db(picked)
-                        print(f"[DB] Inserted whitelist track '{track_name}' ({picked.get('id')}) into blacklisted_songs (fixed=false)")
-                    except Exception as e:
-                        print(f"[DB] Failed to insert whitelist track into blacklisted_songs: {e}")
-
+                    # Queue the whitelist track; it is blacklisted (fixed = false) once its batch is written
+                    playlist_writer.add(picked, source="whitelist")
                     whitelist_added += 1
-                    print(f"[WHITELIST] Added whitelist-sourced track '{track_name}' by '{artist_name}' from playlist '{pl_name}' [{whitelist_added}/10]")
-                    # update local existing artist cache so further checks in this run are accurate
-                    try:
-                        if isinstance(picked.get("artists"), list) and picked["artists"]:
-                            fid = picked["artists"][0].get("id")
-                            if fid:
-                                existing_artist_ids.add(fid)
-                    except Exception:
-                        pass
-                    # small sleep to be polite to Spotify API
-                    time.sleep(0.2)
+                    print(f"[WHITELIST] Queued whitelist-sourced track '{track_name}' by '{artist_name}' from playlist '{pl_name}' [{whitelist_added}/10]")
         except Exception as e:
             print(f"[WARN] Error during whitelist processing: {e}")
         finally:
+            playlist_writer.flush()
+            whitelist_added = playlist_writer.written["whitelist"]
+            telemetry.add_stage_time("whitelist", time.monotonic() - whitelist_start)
             # cleanup & reporting
             try:
-                close_global_driver()
+                close_driver_pool()
             except Exception:
                 pass
-            removed_count = remove_old_tracks_from_playlist(OUTPUT_PLAYLIST_ID, days_old=8)
-            # remove any blacklisted_songs older than 14 days with fixed=false
-            added_removed = cleanup_old_blacklisted_songs(OUTPUT_PLAYLIST_ID, days=14)
-            removed_count += added_removed
+            with telemetry.stage("cleanup"):
+                removed_count = remove_old_tracks_from_playlist(output_playlist, days_old=8)
+                # remove any blacklisted_songs older than 14 days with fixed=false
+                added_removed = cleanup_old_blacklisted_songs(output_playlist, days=14)
+                removed_count += added_removed
             send_playlist_update_sms(songs_added, max_songs, removed_count, OUTPUT_PLAYLIST_ID, whitelist_added, 10)
+            telemetry.print_summary()
+            telemetry.write_report(
+                songs_added=songs_added,
+                max_songs=max_songs,
+                whitelist_added=whitelist_added,
+                removed_count=removed_count,
+                liked_imported=liked_imported,
+                spotify_cache=dict(spotify_cache_stats),
+                playlist_snapshots=dict(playlist_snapshot_stats),
+            )
+            prune_spotify_cache(SPOTIFY_CACHE_TTLS, SPOTIFY_CACHE_MAX_ENTRIES)
+            prune_playlist_snapshots(PLAYLIST_SNAPSHOTS_TTL, PLAYLIST_SNAPSHOTS_MAX_ENTRIES)
+            print(f"[CACHE] Spotify read cache: {spotify_cache_stats['hits']} hits, {spotify_cache_stats['misses']} misses")
+            print(f"[CACHE] Playlist snapshots: {playlist_snapshot_stats['hits']} hits, {playlist_snapshot_stats['misses']} misses")
+            similar_artist_graph.close()
+            close_db_pool()
+            if cassette.active:
+                cassette.report(songs_added + whitelist_added)
+                cassette.save()
             print(f"[INFO] Run complete. Enhanced added: {songs_added}/{max_songs} | Whitelist added: {whitelist_added}/10 | Old removed: {removed_count}")
 
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# JSON run report written at the end of script.py's run (next to the SMS summary)
+RUN_REPORT_FILE = os.environ.get("RUN_REPORT_FILE") or "run_report.json"
+
+# upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _bucket_label(seconds):
+    for bound in LATENCY_BUCKETS:
+        if seconds <= bound:
+            return f"<={int(bound * 1000)}ms"
+    return f">{int(LATENCY_BUCKETS[-1] * 1000)}ms"
+
+class Telemetry:
+    """
+    Thread-safe run instrumentation: stage timers, per-endpoint call counts with
+    latency histograms, and plain counters (429s, retries, ...). report() returns
+    everything as a JSON-serializable dict.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.monotonic()
+        self.stages = {}
+        self.calls = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_stage_time(self, name, seconds):
+        with self._lock:
+            st = self.stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            st["count"] += 1
+            st["total_s"] += seconds
+            st["max_s"] = max(st["max_s"], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.monotonic() - start)
+
+    def lap(self, name):
+        """
+        Close this thread's current lap stage (if any) and start `name`.
+        For functions with several sequential steps and early returns; pair with end_lap().
+        """
+        now = time.monotonic()
+        current = getattr(self._local, "lap", None)
+        if current:
+            self.add_stage_time(current[0], now - current[1])
+        self._local.lap = (name, now)
+
+    def end_lap(self):
+        """Close this thread's current lap stage. Returns its name (or None)."""
+        current = getattr(self._local, "lap", None)
+        self._local.lap = None
+        if not current:
+            return None
+        self.add_stage_time(current[0], time.monotonic() - current[1])
+        return current[0]
+
+    def record_call(self, service, endpoint, seconds, status="ok"):
+        key = f"{service}:{endpoint}"
+        with self._lock:
+            st = self.calls.setdefault(key, {"count": 0, "total_s": 0.0, "max_s": 0.0, "status": Counter(), "latency": Counter()})
+            st["count"] += 1
+            st["total_s"] += seconds
+            st["max_s"] = max(st["max_s"], seconds)
+            st["status"][str(status)] += 1
+            st["latency"][_bucket_label(seconds)] += 1
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def report(self, **summary):
+        with self._lock:
+            stages = {k: dict(v, total_s=round(v["total_s"], 3), max_s=round(v["max_s"], 3)) for k, v in self.stages.items()}
+            calls = {
+                k: {
+                    "count": v["count"],
+                    "total_s": round(v["total_s"], 3),
+                    "avg_ms": round(v["total_s"] / v["count"] * 1000, 1) if v["count"] else 0.0,
+                    "max_s": round(v["max_s"], 3),
+                    "status": dict(v["status"]),
+                    "latency": dict(v["latency"]),
+                }
+                for k, v in self.calls.items()
+            }
+            counters = dict(self.counters)
+        return {
+            "started_at": self.started_at.isoformat(),
+            "wall_s": round(time.monotonic() - self._start, 3),
+            "summary": summary,
+            "stages": stages,
+            "calls": calls,
+            "counters": counters,
+        }
+
+    def write_report(self, path=RUN_REPORT_FILE, **summary):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.report(**summary), f, indent=2, default=str)
+            print(f"[INFO] Wrote run report to {path}")
+        except Exception as e:
+            print(f"[WARN] Could not write run report {path}: {e}")
+
+    def print_summary(self, top=8):
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+            calls = sorted(self.calls.items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+            counters = dict(self.counters)
+        for name, st in stages:
+            print(f"[TIMING] {name}: {st['total_s']:.2f}s over {st['count']}x (max {st['max_s']:.2f}s)")
+        for key, st in calls[:top]:
+            print(f"[TIMING]   {st['count']}x {key} {st['total_s']:.2f}s (max {st['max_s']:.2f}s)")
+        if counters:
+            print(f"[TIMING] counters: {counters}")
+
+telemetry = Telemetry()
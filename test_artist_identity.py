@@ -0,0 +1,20 @@
+from script import ArtistIdentityMap
+
+def _artists(*pairs):
+    return {"artists": {"items": [{"id": aid, "name": name} for aid, name in pairs]}}
+
+def test_name_lookup_only_trusts_search_and_related_artists():
+    identity = ArtistIdentityMap()
+    # a playlist track's artist that merely shares the name
+    identity.observe_response({"items": [{"track": {"artists": [{"id": "other", "name": "Nova"}]}}]}, "playlist_items")
+    assert identity.find_by_name("Nova") is None
+    assert identity.get("other")["name"] == "Nova"
+
+    identity.observe_response(_artists(("a1", "Nova")), "search:artist")
+    assert identity.find_by_name(" nova ")["id"] == "a1"
+
+def test_ambiguous_names_fall_back_to_search():
+    identity = ArtistIdentityMap()
+    identity.observe_response(_artists(("a1", "Nova")), "search")
+    identity.observe_response({"artists": [{"id": "a2", "name": "Nova"}]}, "artist_related_artists")
+    assert identity.find_by_name("Nova") is None
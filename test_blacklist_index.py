@@ -0,0 +1,50 @@
+import db_helpers
+from db_helpers import BlacklistIndex
+
+def test_index_counts_each_song_once_per_artist():
+    index = BlacklistIndex()
+    index.add_song("s1", "a1")
+    index.add_song("s1", "a1")
+    index.add_song("s2", "a1")
+    index.add_song("s3")
+    index.add_song(None, "a1")
+    assert index.songs == {"s1", "s2", "s3"}
+    assert index.artist_song_counts == {"a1": 2}
+
+def test_loaded_index_answers_lookups_without_the_db(monkeypatch):
+    monkeypatch.setattr(db_helpers, "BLACKLIST_INDEX", None)
+    rows = [
+        ("song", "s1", "a1"),
+        ("song", "s2", "a1"),
+        ("artist", "a9", None),
+        ("playlist", "p1", None),
+        ("song", None, "a2"),
+    ]
+    monkeypatch.setattr(db_helpers, "db_query", lambda sql, params=None, fetch=False: rows)
+    index = db_helpers.load_blacklist_index()
+    assert index is db_helpers.BLACKLIST_INDEX
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("DB queried although the index is loaded")
+    monkeypatch.setattr(db_helpers, "db_query", no_db)
+    monkeypatch.setattr(db_helpers, "db_enabled", lambda: False)
+    assert db_helpers.is_track_blacklisted("s1")
+    assert not db_helpers.is_track_blacklisted("s3")
+    assert db_helpers.blacklisted_artist_count("a1") == 2
+    assert db_helpers.blacklisted_artist_count("a2") == 0
+    assert db_helpers.is_artist_blacklisted("a9")
+    assert db_helpers.is_playlist_blacklisted("p1")
+    assert not db_helpers.is_playlist_blacklisted("p2")
+
+    # writes made during the run are visible to later lookups
+    db_helpers.add_blacklisted_song("s3", artist_id="a1")
+    db_helpers.add_or_update_user_playlist("p2", blacklisted=True)
+    assert db_helpers.is_track_blacklisted("s3")
+    assert db_helpers.blacklisted_artist_count("a1") == 3
+    assert db_helpers.is_playlist_blacklisted("p2")
+
+def test_load_returns_none_when_db_unavailable(monkeypatch):
+    monkeypatch.setattr(db_helpers, "BLACKLIST_INDEX", None)
+    monkeypatch.setattr(db_helpers, "db_query", lambda sql, params=None, fetch=False: None)
+    assert db_helpers.load_blacklist_index() is None
+    assert db_helpers.BLACKLIST_INDEX is None
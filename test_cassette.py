@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+
+import psycopg2.extras
+
+import cassette as cassette_module
+import db_helpers
+import script
+from cassette import Cassette, RecordedResponse, ReplayRow
+from fake_api import FakeCatalog, start_fake_api
+
+class _Description:
+    def __init__(self, cols):
+        self.index = {c: i for i, c in enumerate(cols)}
+        self.description = [(c,) for c in cols]
+
+def _dict_row(cols, vals):
+    row = psycopg2.extras.DictRow(_Description(cols))
+    for i, v in enumerate(vals):
+        row[i] = v
+    return row
+
+class _FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"similarartists": {"artist": [{"name": "B", "match": "0.5"}]}}
+
+def test_record_then_replay_db_rows_and_http(tmp_path, monkeypatch):
+    path = str(tmp_path / "cassette.json")
+    created = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    rows = [_dict_row(["artist_id", "created_at"], ["a1", created])]
+
+    recorder = Cassette("record", path=path)
+    monkeypatch.setattr(db_helpers, "cassette", recorder)
+    monkeypatch.setattr(db_helpers, "_db_query", lambda sql, params, fetch: rows)
+    assert db_helpers.db_query("SELECT artist_id, created_at FROM t WHERE x = %s", (1,), fetch=True) == rows
+    resp = recorder.call_http("lastfm", "artist.getsimilar", {"artist": "A"}, _FakeResponse)
+    assert resp.json()["similarartists"]["artist"][0]["name"] == "B"
+    recorder.save()
+
+    player = Cassette("replay", path=path)
+    monkeypatch.setattr(db_helpers, "cassette", player)
+    monkeypatch.setattr(db_helpers, "_db_query", lambda *a: (_ for _ in ()).throw(AssertionError("DB hit during replay")))
+    assert db_helpers.db_enabled()
+    replayed = db_helpers.db_query("SELECT artist_id, created_at FROM t WHERE x = %s", (1,), fetch=True)
+    row = replayed[0]
+    assert isinstance(row, ReplayRow)
+    assert row.get("artist_id") == "a1" and row["artist_id"] == "a1" and row[0] == "a1"
+    assert row.get("created_at") == created
+    assert row.get("missing") is None
+
+    resp = player.call_http("lastfm", "artist.getsimilar", {"artist": "A"}, _FakeResponse)
+    assert isinstance(resp, RecordedResponse)
+    assert resp.status_code == 200
+    assert resp.json()["similarartists"]["artist"][0]["match"] == "0.5"
+    assert player.misses == {} and player.divergences == {}
+
+def test_replay_miss_and_divergence(tmp_path):
+    path = str(tmp_path / "cassette.json")
+    recorder = Cassette("record", path=path)
+    recorder.call("db", "SELECT 1", [["2024-01-01"], True], lambda: [[1]])
+    recorder.save()
+
+    player = Cassette("replay", path=path)
+    # same endpoint, different (time-based) args: falls back to the recorded entry
+    assert player.call("db", "SELECT 1", [["2025-06-01"], True], lambda: None) == [[1]]
+    assert player.divergences["db"] == 1
+    # nothing left to replay: miss returns the default
+    resp = player.call_http("lastfm", "artist.getsimilar", {"artist": "A"}, _FakeResponse)
+    assert resp.status_code == 599
+    assert player.misses["lastfm"] == 1
+
+def test_replay_pins_the_clock_to_the_recording(tmp_path, monkeypatch):
+    path = str(tmp_path / "cassette.json")
+    recorder = Cassette("record", path=path)
+    recorded_now = recorder.now()
+    recorder.save()
+
+    class _Later(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return recorded_now + timedelta(days=90)
+
+    # replay three months later: windows and staleness must still see the recording's clock
+    monkeypatch.setattr(cassette_module, "datetime", _Later)
+    player = Cassette("replay", path=path)
+    assert player.now() == recorder.started_at
+
+    monkeypatch.setattr(script, "cassette", player)
+    played_at = recorded_now - timedelta(days=10)
+    plays = script.build_artist_play_map([{"artist": "a", "track": "t", "played_at": played_at}], days_limit=30)
+    assert list(plays["a"]) == [int(played_at.timestamp())]
+    # still inside both the 14- and 60-day windows
+    assert script.calculate_weights({"x": {"name": "a"}}, plays) == {"x": 70}
+
+def _run_script(env, cwd):
+    proc = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "script.py")],
+                          env=env, cwd=cwd, capture_output=True, text=True, timeout=300)
+    assert proc.returncode == 0, proc.stdout[-2000:] + proc.stderr[-2000:]
+    return proc.stdout
+
+def test_record_then_replay_a_whole_run_against_the_fake_api(tmp_path):
+    server, fake_env = start_fake_api(FakeCatalog(n_artists=200, n_playlists=300, n_liked=100, n_scrobbles=1000))
+    try:
+        env = {k: v for k, v in os.environ.items() if not k.startswith(("CASSETTE_", "DATABASE_URL"))}
+        env.update(fake_env)
+        env.update({"SPOTIFY_REFRESH_TOKEN": "fake", "LASTFM_API_KEY": "fake", "LASTFM_USERNAME": "fake",
+                    "PLAYLIST_ID": "output", "SPOTIFY_MAX_CALLS_PER_SEC": "1000", "SPOTIFY_BURST": "1000",
+                    "CASSETTE_FILE": str(tmp_path / "cassette.json")})
+        recorded = _run_script(dict(env, CASSETTE_MODE="record"), tmp_path)
+    finally:
+        server.shutdown()
+    # recorded without DATABASE_URL: replay must skip the DB branches too
+    with open(tmp_path / "cassette.json") as f:
+        assert json.load(f)["meta"]["db_enabled"] is False
+
+    replayed = _run_script(dict(env, CASSETTE_MODE="replay"), tmp_path)
+    assert "[CASSETTE]   misses:" not in replayed
+    summary = [line for line in recorded.splitlines() if line.startswith("[INFO] Run complete.")]
+    assert summary and summary == [line for line in replayed.splitlines() if line.startswith("[INFO] Run complete.")]
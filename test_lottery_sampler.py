@@ -0,0 +1,29 @@
+import random
+from collections import Counter
+
+import pytest
+
+from script import LotterySampler
+
+def test_draws_every_positive_weight_once_then_none():
+    weights = {"a": 1.0, "b": 5.0, "c": 0.0, "d": -2.0, "e": 0.5}
+    sampler = LotterySampler(weights, rng=random.Random(1))
+    assert len(sampler) == 3
+    drawn = []
+    while (pick := sampler.draw()) is not None:
+        drawn.append(pick)
+    assert sorted(drawn) == [("a", 1.0), ("b", 5.0), ("e", 0.5)]
+    assert len(sampler) == 0
+    assert sampler.draw() is None
+
+def test_first_draw_is_proportional_to_weight():
+    weights = {"a": 1.0, "b": 3.0}
+    rng = random.Random(7)
+    firsts = Counter(LotterySampler(weights, rng=rng).draw()[0] for _ in range(4000))
+    assert firsts["b"] / 4000 == pytest.approx(0.75, abs=0.03)
+
+def test_same_seed_same_order():
+    weights = {str(i): float(i % 7 + 1) for i in range(50)}
+    first = LotterySampler(weights, rng=random.Random(42))
+    second = LotterySampler(weights, rng=random.Random(42))
+    assert [first.draw() for _ in range(50)] == [second.draw() for _ in range(50)]
@@ -0,0 +1,108 @@
+import pytest
+
+import script
+
+@pytest.fixture
+def playlist(monkeypatch):
+    """A 250-item playlist (resize via size[0]) behind stubbed Spotify calls and snapshot storage."""
+    pages, stored, size = [], {}, [250]
+
+    def call(fn, playlist_id, fields=None, limit=100, offset=0):
+        if fn == script.sp.playlist:
+            pages.append("meta")
+            return {"snapshot_id": "s1"}
+        pages.append(offset)
+        return {"total": size[0], "items": [{"added_at": None, "track": {"id": f"t{i}", "artists": []}} for i in range(offset, min(size[0], offset + limit))]}
+
+    monkeypatch.setattr(script, "safe_spotify_call", call)
+    monkeypatch.setattr(script, "get_playlist_snapshot", lambda pid, snapshot_id: stored.get((pid, snapshot_id)))
+    monkeypatch.setattr(script, "store_playlist_snapshot", lambda pid, snapshot_id, items, partial=False, total=None: stored.__setitem__((pid, snapshot_id), (items, partial, total)))
+    monkeypatch.setattr(script, "_playlist_contents_memo", {})
+    return pages, stored, size
+
+def test_first_page_only_is_stored_as_partial(playlist):
+    pages, stored, size = playlist
+    assert len(script.get_playlist_contents("p", first_page_only=True)) == 100
+    assert len(script.get_playlist_contents("p", first_page_only=True)) == 100
+    assert pages == ["meta", 0]
+    items, partial, _ = stored[("p", "s1")]
+    assert partial and len(items) == 100
+
+def test_known_snapshot_id_skips_the_metadata_call(playlist, monkeypatch):
+    pages, stored, size = playlist
+    assert len(script.get_playlist_contents("p", first_page_only=True, snapshot_id="s1")) == 100
+    assert pages == [0]
+    # next run: the stored first page answers without any call, and a full read pages on from it
+    monkeypatch.setattr(script, "_playlist_contents_memo", {})
+    assert len(script.get_playlist_contents("p", first_page_only=True, snapshot_id="s1")) == 100
+    assert pages == [0]
+    monkeypatch.setattr(script, "_playlist_contents_memo", {})
+    assert len(script.get_playlist_contents("p", snapshot_id="s1")) == 250
+    assert pages == [0, 100, 200]
+    items, partial, _ = stored[("p", "s1")]
+    assert not partial and len(items) == 250
+
+def test_full_read_pages_on_from_the_first_page(playlist):
+    pages, stored, size = playlist
+    script.get_playlist_contents("p", first_page_only=True)
+    items = script.get_playlist_contents("p")
+    assert [it["track"]["id"] for it in items] == [f"t{i}" for i in range(250)]
+    assert pages == ["meta", 0, 100, 200]
+    assert stored[("p", "s1")] == (items, False, 250)
+    assert len(script.get_playlist_contents("p", first_page_only=True)) == 100
+    assert pages == ["meta", 0, 100, 200]
+
+def test_mid_pagination_failure_is_not_stored_or_memoized(playlist, monkeypatch):
+    pages, stored, size = playlist
+    call = script.safe_spotify_call
+
+    def flaky(fn, playlist_id, fields=None, limit=100, offset=0):
+        if fn != script.sp.playlist and offset == 100:
+            pages.append(offset)
+            return None
+        return call(fn, playlist_id, fields=fields, limit=limit, offset=offset)
+
+    monkeypatch.setattr(script, "safe_spotify_call", flaky)
+    assert script.get_playlist_contents("p") is None
+    assert stored == {}
+    assert "p" not in script._playlist_contents_memo
+
+    monkeypatch.setattr(script, "safe_spotify_call", call)
+    assert len(script.get_playlist_contents("p")) == 250
+    assert stored[("p", "s1")][0][-1]["track"]["id"] == "t249"
+
+def test_sampling_fetches_only_the_pages_holding_the_drawn_offsets(playlist, monkeypatch):
+    pages, stored, size = playlist
+    size[0] = 10000
+    monkeypatch.setattr(script.random, "sample", lambda population, k: [5, 150, 9999][:k])
+    sampled = script.sample_playlist_items("p", 3)
+    assert [it["track"]["id"] for it in sampled] == ["t5", "t150", "t9999"]
+    assert pages == ["meta", 0, 100, 9900]
+    # only the first page is stored, still as partial
+    items, partial, _ = stored[("p", "s1")]
+    assert partial and len(items) == 100
+
+def test_sampling_a_small_playlist_reads_it_in_full(playlist, monkeypatch):
+    pages, stored, size = playlist
+    monkeypatch.setattr(script.random, "sample", lambda population, k: [5, 150, 249][:k])
+    sampled = script.sample_playlist_items("p", 3)
+    assert [it["track"]["id"] for it in sampled] == ["t5", "t150", "t249"]
+    assert pages == ["meta", 0, 100, 200]
+    assert stored[("p", "s1")][1] is False
+
+def test_expiry_reloads_an_output_playlist_that_failed_to_load(monkeypatch):
+    old = {"added_at": "2020-01-01T00:00:00Z", "track": {"id": "old", "artists": [{"id": "a1", "name": "A"}]}}
+    new = {"added_at": script.cassette.now().strftime("%Y-%m-%dT%H:%M:%SZ"), "track": {"id": "new", "artists": [{"id": "a2", "name": "B"}]}}
+    responses = [None, [old, new]]
+    monkeypatch.setattr(script, "get_playlist_contents", lambda pid, reuse_in_run=True: responses.pop(0))
+    removed_uris = []
+    monkeypatch.setattr(script, "safe_spotify_call", lambda fn, pid, uris: removed_uris.extend(uris) or {"snapshot_id": "s2"})
+
+    output = script.OutputPlaylist("out")
+    assert not output.load()
+    artist_ids = output.artist_ids
+    assert script.remove_old_tracks_from_playlist(output, days_old=8) == 1
+    assert removed_uris == ["spotify:track:old"]
+    assert output.track_ids() == {"new"}
+    # the dedupe set is refreshed in place for holders of the original reference
+    assert artist_ids is output.artist_ids and "a2" in artist_ids
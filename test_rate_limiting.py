@@ -0,0 +1,94 @@
+import pytest
+
+import script
+from script import TokenBucket, backoff_delay
+
+class _Clock:
+    """Stands in for time.monotonic/time.sleep: sleeping advances the clock instantly."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(script.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(script.time, "sleep", clock.sleep)
+    return clock
+
+def test_bucket_spends_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+
+def test_rate_limited_blocks_halves_rate_and_recovers(clock):
+    bucket = TokenBucket(rate=4, min_rate=1)
+    bucket.on_rate_limited(3.0)
+    assert bucket.rate == 2
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(3.0)]
+
+    bucket.on_rate_limited(0)
+    bucket.on_rate_limited(0)
+    assert bucket.rate == 1  # never below min_rate
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 4  # never above the configured rate
+
+def test_backoff_delay_is_jittered_and_capped(monkeypatch):
+    monkeypatch.setattr(script._backoff_rng, "uniform", lambda lo, hi: hi)
+    assert backoff_delay(0) == 1.0
+    assert backoff_delay(3, base=2.0) == 16.0
+    assert backoff_delay(10) == 30.0
+    monkeypatch.setattr(script._backoff_rng, "uniform", lambda lo, hi: lo)
+    assert backoff_delay(5) == 0
+
+class _RecordingLimiter:
+    def __init__(self):
+        self.rate_limited = []
+
+    def acquire(self):
+        pass
+
+    def on_success(self):
+        pass
+
+    def on_rate_limited(self, retry_after):
+        self.rate_limited.append(retry_after)
+
+def test_spotify_429_reaches_shared_limiter_with_retry_after(monkeypatch):
+    from fake_api import FakeCatalog, FaultConfig, start_fake_api
+
+    catalog = FakeCatalog(n_artists=10, n_playlists=5, n_users=2, n_liked=5, n_scrobbles=5)
+    server, env = start_fake_api(catalog=catalog, faults=FaultConfig(rate_429=1.0, retry_after=7))
+    try:
+        client = script._build_spotify_client(auth="test")
+        client.prefix = env["SPOTIFY_API_URL"]
+        limiter = _RecordingLimiter()
+        monkeypatch.setattr(script, "spotify_rate_limiter", limiter)
+        assert script._safe_spotify_call(client.artist, "a1") is None
+    finally:
+        server.shutdown()
+    # one request per safe_spotify_call attempt: the transport doesn't retry 429s itself
+    assert sum(n for (_, status), n in server.stats.items() if status == 429) == 3
+    assert len(limiter.rate_limited) == 3
+    assert all(7 <= wait < 7 + 30 for wait in limiter.rate_limited)
+
+def test_backoff_jitter_leaves_the_seeded_global_rng_alone():
+    script.random.seed(1234)
+    expected = script.random.random()
+    script.random.seed(1234)
+    for attempt in range(5):
+        backoff_delay(attempt)
+    assert script.random.random() == expected
@@ -0,0 +1,106 @@
+import random
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+import script
+from script import SimilarArtistGraph
+
+# stored graph: a -> {b, c}, b -> {d}, c -> {e}; d and e have never been fetched
+EDGES = {
+    "a": [("b", "B", "id-b", 1.0, "lastfm"), ("c", "C", None, 0.5, "lastfm"), ("c", "C", "id-c", 0.5, "spotify")],
+    "b": [("d", "D", None, 1.0, "lastfm")],
+    "c": [("e", "E", None, 1.0, "lastfm")],
+}
+
+@pytest.fixture
+def make_graph(monkeypatch):
+    def make(stored):
+        now = datetime.now(timezone.utc)
+
+        def load(keys):
+            edges = {k: stored[k] for k in keys if k in stored}
+            refreshed = {(k, s): now for k in edges for s in SimilarArtistGraph.SOURCES}
+            return edges, refreshed
+
+        monkeypatch.setattr(script, "load_similar_artists", load)
+        graph = SimilarArtistGraph()
+        graph._pool.shutdown()
+        graph._pool = None
+        graph.refreshed = []
+        monkeypatch.setattr(graph, "refresh", lambda name, artist_id=None, sources=(): graph.refreshed.append(name))
+        return graph
+    return make
+
+@pytest.fixture
+def graph(make_graph):
+    return make_graph(EDGES)
+
+def test_neighbors_merge_sources(graph):
+    assert graph.neighbors("A") == {
+        "b": {"name": "B", "id": "id-b", "weight": 1.0},
+        "c": {"name": "C", "id": "id-c", "weight": 1.0},
+    }
+    assert graph.refreshed == []
+
+def test_one_hop_sample_returns_distinct_neighbors(graph):
+    picked = graph.sample("A", k=5, hops=1, rng=random.Random(3))
+    assert sorted(p["key"] for p in picked) == ["b", "c"]
+
+def test_one_hop_exclusions_do_not_eat_into_k(make_graph):
+    # one heavy excluded neighbour would win most walks if it were only dropped afterwards
+    neighbors = [("x", "X", None, 1000.0, "lastfm")] + [(f"n{i}", f"N{i}", None, 1.0, "lastfm") for i in range(12)]
+    graph = make_graph({"a": neighbors})
+    picked = graph.sample("A", k=10, hops=1, exclude=["X"], rng=random.Random(0))
+    assert len(picked) == 10
+    assert "x" not in {p["key"] for p in picked}
+
+def test_two_hop_sample_excludes_first_hop(graph):
+    picked = graph.sample("A", k=5, hops=2, exclude=["B", "C"], rng=random.Random(3))
+    assert sorted(p["key"] for p in picked) == ["d", "e"]
+
+def test_cold_second_hop_stops_at_first_hop_and_queues_refresh(make_graph):
+    graph = make_graph({"a": EDGES["a"]})
+    assert graph.sample("A", k=5, hops=2, exclude=["B", "C"], rng=random.Random(3)) == []
+    assert sorted(set(graph.refreshed)) == ["B", "C"]
+
+def test_cold_graph_step4_falls_back_to_untried_first_hop_neighbors(make_graph):
+    neighbors = [(f"n{i}", f"N{i}", None, 1.0 / (i + 1), "lastfm") for i in range(15)]
+    graph = make_graph({"a": neighbors})
+    rng = random.Random(5)
+    # same calls as Step 3 / Step 4 in _select_track_for_artist
+    step3 = graph.sample("A", k=10, hops=1, rng=rng)
+    tried = ["A"] + [c["name"] for c in step3]
+    step4 = graph.sample("A", k=10, hops=2, exclude=tried, rng=rng)
+    assert len(step3) == 10
+    assert len(step4) == 5
+    assert {c["key"] for c in step3}.isdisjoint(c["key"] for c in step4)
+    assert {c["key"] for c in step3} | {c["key"] for c in step4} == {f"n{i}" for i in range(15)}
+
+def test_background_refreshes_are_capped(monkeypatch):
+    release = threading.Event()
+    graph = SimilarArtistGraph(max_pending=2)
+    monkeypatch.setattr(graph, "refresh", lambda *args: release.wait(5))
+    try:
+        for name in ("X", "X", "Y", "Z", "W"):
+            graph._refresh_later(name, None, ("lastfm",))
+        assert graph._inflight == {"x", "y"}
+    finally:
+        release.set()
+        graph.close()
+
+def test_spotify_source_without_artist_id_counts_as_refreshed(monkeypatch):
+    monkeypatch.setattr(script, "load_similar_artists", lambda keys: ({}, {}))
+    monkeypatch.setattr(script, "lastfm_get", lambda params: (_ for _ in ()).throw(RuntimeError("offline")))
+    stored = []
+    monkeypatch.setattr(script, "store_similar_artists", lambda key, source, neighbors: stored.append((key, source, neighbors)))
+    graph = SimilarArtistGraph()
+    try:
+        graph.refresh("Nobody")
+    finally:
+        graph.close()
+    # the failed Last.fm call stays missing; the unaskable Spotify source is recorded as empty
+    assert stored == [("nobody", "spotify", [])]
+    assert ("nobody", "spotify") in graph._refreshed
+    assert ("nobody", "lastfm") not in graph._refreshed